@@ -7,13 +7,21 @@ class Player(Enum):
 #that contain abstract methods that has to be implemented by subclasses.
 #These abstract methods, is what constitute the specialization of the A*
 #for this problem domain.
-class Node(object):
-    __metaclass__ = ABCMeta
+#Successors are produced lazily, and the search tree is not kept in memory:
+#nodes only store their children and a reference to their parent if
+#retain_tree is set. Nodes use __slots__, as millions are created per move.
+class Node(metaclass=ABCMeta):
+    __slots__ = ("children", "parent", "player", "level", "root")
     max_depth = 3
+    retain_tree = False
+    #Number of nodes created so far. A list, since assigning to a class
+    #attribute for every node would slow down attribute lookups.
+    allocations = [0]
 
     def __init__(self, parent=None, player=Player.MAX):
+        Node.allocations[0] += 1
         self.children = None
-        self.parent = parent
+        self.parent = parent if Node.retain_tree else None
         self.player =player
         self.level = 0
         self.root = True
@@ -21,7 +29,8 @@ class Node(object):
             self.root = False
             self.level += parent.level +1
 
-    #Generate successor nodes/states from itself.
+    #Generate successor nodes/states from itself. May be a generator, so
+    #children are only created as the search asks for them.
     @abstractmethod
     def generate_successors(self, player):
         pass
@@ -34,6 +43,12 @@ class Node(object):
     @abstractmethod
     def is_state_terminal(self):
         pass
+
+    #Hashable key identifying the state, used by the transposition table.
+    @abstractmethod
+    def state_key(self):
+        pass
+
     def is_max_player(self):
         return self.player is Player.MAX
 
@@ -41,12 +56,44 @@ class Node(object):
         return not self.is_max_player()
 
     def get_min_children(self):
-        self.children = self.generate_successors(Player.MIN)
-        return self.children
+        return self.get_successors(Player.MIN)
 
     def get_max_children(self):
-        self.children = self.generate_successors(Player.MAX)
-        return self.children
+        return self.get_successors(Player.MAX)
+
+    def get_successors(self, player):
+        '''
+        Returns an iterable over the children. With retain_tree set they are
+        created at once and kept in self.children, and later searches of the
+        same node use them again. Leaves at the depth limit, most of the
+        tree, are not kept, since keeping them makes garbage collection
+        slower than generating them again.
+        '''
+        if Node.retain_tree and self.level < Node.max_depth:
+            if self.children is None:
+                self.children = list(self.generate_successors(player))
+            return self.children
+        return self.generate_successors(player)
+
+    def make_root(self):
+        '''
+        Detaches the node from its parent, so a new search can start from it
+        and use the children retained below it. Levels are renumbered from
+        the node. Returns the number of nodes in the retained subtree.
+        '''
+        self.parent = None
+        self.root = True
+        self.level = 0
+        count = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            count += 1
+            if node.children:
+                for child in node.children:
+                    child.level = node.level + 1
+                    stack.append(child)
+        return count
 
     def set_parent(self, node):
         self.parent = node
@@ -64,4 +111,11 @@ class Node(object):
         return self.reached_max_depth() or self.is_state_terminal()
 
     def reached_max_depth(self):
-        return Node.max_depth < self.level
\ No newline at end of file
+        return Node.max_depth < self.level
+
+    #Objects allocated so far for nodes, including the state they hold.
+    def allocation_count(self):
+        return Node.allocations[0]
+
+    def remaining_depth(self):
+        return Node.max_depth - self.level
\ No newline at end of file
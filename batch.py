@@ -0,0 +1,327 @@
+'''
+Batched leaf evaluation with NumPy. The search first walks the tree and
+only collects the boards of its leaves, the frontier. All of them are then
+scored at once by vectorized versions of the heuristic components, and the
+values are backed up the tree. NumPy is optional, the other solvers do not
+need it.
+
+move_boards does the same for move generation, moving many boards in all
+four directions at once. Running this module checks it against
+GameState.perform_action on random boards:
+
+    python batch.py [number of boards]
+'''
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import random
+import sys
+
+from abstractnode import Player
+from model import GameNode, GameState, Direction
+from search import Expectimax
+from cancel import SearchCancelled
+import bitboard
+
+#Bit offset of each of the 16 slots in a packed board.
+_SHIFTS = None if np is None else np.arange(0, 64, 4, dtype=np.uint64)
+#Weight of each neighbor pair along a line, see GameNode.monotonicity.
+_POSITIONS = None if np is None else np.arange(1, 4)
+#Multiplier packing the four exponents of a line into a row table index.
+_LINE_WEIGHTS = None if np is None else 1 << np.arange(0, 16, 4)
+
+
+def _build_move_tables():
+    #The score of a RIGHT move is the score of the reversed row moved LEFT.
+    score_right = [bitboard.ROW_SCORE[bitboard.reverse_row(r)]
+        for r in range(bitboard.ROW_MASK + 1)]
+    return (np.array(bitboard.ROW_LEFT, dtype=np.int64),
+        np.array(bitboard.ROW_RIGHT, dtype=np.int64),
+        np.array(bitboard.ROW_SCORE, dtype=np.int64),
+        np.array(score_right, dtype=np.int64))
+
+#The row tables of bitboard.py as arrays, for the row and column indexes
+#of many boards at once.
+if np is not None:
+    _ROW_LEFT, _ROW_RIGHT, _SCORE_LEFT, _SCORE_RIGHT = _build_move_tables()
+
+
+def unpack_boards(boards):
+    '''
+    Returns the exponents of an array of N packed boards as an N x 4 x 4
+    array, indexed by board, y and x.
+    '''
+    boards = np.asarray(boards, dtype=np.uint64)
+    grid = (boards[:, None] >> _SHIFTS) & np.uint64(0xF)
+    return grid.astype(np.int64).reshape(-1, 4, 4)
+
+
+def pack_boards(grid):
+    '''
+    The inverse of unpack_boards. Takes an N x 16 (or N x 4 x 4) array of
+    exponents and returns an array of N packed boards.
+    '''
+    grid = np.asarray(grid).reshape(-1, 16).astype(np.uint64)
+    return np.bitwise_or.reduce(grid << _SHIFTS, axis=1)
+
+
+def _unpack_lines(lines):
+    return (lines[..., None] >> np.arange(0, 16, 4)) & 0xF
+
+
+def move_boards(boards):
+    '''
+    Moves N boards in all four directions at once. boards is an N x 16
+    array of exponents, slot i = x + 4*y as in bitboard.py. Returns
+    (moved_boards, moved, scores), indexed by direction and board:
+
+        moved_boards - 4 x N x 16 exponents after each move
+        moved        - 4 x N booleans, True where the move changes the board
+        scores       - 4 x N scores, the sum of the created tile values
+
+    The directions are in the order of Direction, LEFT, RIGHT, UP, DOWN, so
+    moved_boards[d.value - 1] is the result of perform_action(d). Rows and
+    columns are looked up in the row tables of bitboard.py, so the rules
+    are the same as for a single board.
+    '''
+    grid = np.asarray(boards, dtype=np.int64).reshape(-1, 4, 4)
+    rows = (grid*_LINE_WEIGHTS).sum(axis=2)
+    cols = (grid*_LINE_WEIGHTS[:, None]).sum(axis=1)
+    n = grid.shape[0]
+    moved_boards = np.stack([
+        _unpack_lines(_ROW_LEFT[rows]),
+        _unpack_lines(_ROW_RIGHT[rows]),
+        _unpack_lines(_ROW_LEFT[cols]).transpose(0, 2, 1),
+        _unpack_lines(_ROW_RIGHT[cols]).transpose(0, 2, 1),
+        ]).reshape(4, n, 16)
+    moved = (moved_boards != grid.reshape(1, n, 16)).any(axis=2)
+    scores = np.stack([
+        _SCORE_LEFT[rows].sum(axis=1),
+        _SCORE_RIGHT[rows].sum(axis=1),
+        _SCORE_LEFT[cols].sum(axis=1),
+        _SCORE_RIGHT[cols].sum(axis=1),
+        ])
+    return moved_boards, moved, scores
+
+
+def random_boards(n, rng):
+    '''
+    n random boards as packed integers, from nearly empty to full, with
+    exponents up to 15 so the merge limit is covered too.
+    '''
+    boards = []
+    for _ in range(n):
+        fill = rng.random()
+        top = rng.randint(1, bitboard.MAX_EXPONENT)
+        #A narrow range of exponents gives many equal neighbors.
+        low = rng.randint(1, top)
+        b = 0
+        for i in range(16):
+            if rng.random() < fill:
+                b |= rng.randint(low, top) << (4*i)
+        boards.append(b)
+    return boards
+
+
+def check_moves(n=20000, seed=0):
+    '''
+    Differential test of move_boards against GameState.perform_action and
+    bitboard.move_score on n random boards. Raises on the first mismatch.
+    '''
+    boards = random_boards(n, random.Random(seed))
+    moved_boards, moved, scores = move_boards(unpack_boards(boards))
+    moved_boards = pack_boards(moved_boards.reshape(-1, 16)).reshape(4, n)
+    for k, b in enumerate(boards):
+        for direction in Direction:
+            d = direction.value - 1
+            state = GameState()
+            state.bitboard = b
+            movement = state.perform_action(direction)
+            expected = (state.bitboard, movement, bitboard.move_score(b, direction.value))
+            found = (int(moved_boards[d, k]), bool(moved[d, k]), int(scores[d, k]))
+            if expected != found:
+                raise Exception("move_boards differs for board " + hex(b) + " "
+                    + direction.name + ": " + str(found) + " != " + str(expected))
+    return n
+
+
+def components(grid):
+    '''
+    The heuristic components of HeuristicTable, (monotonicity, empty slots,
+    merges, largest exponent), as four arrays for an N x 4 x 4 grid.
+    '''
+    row_steps = np.diff(grid, axis=2)
+    col_steps = np.diff(grid, axis=1)
+    mono = ((np.sign(row_steps)*_POSITIONS).sum(axis=(1, 2))
+        + (np.sign(col_steps)*_POSITIONS[:, None]).sum(axis=(1, 2)))
+    empty = (grid == 0).sum(axis=(1, 2))
+    merges = (np.where(row_steps == 0, grid[:, :, 1:], 0).sum(axis=(1, 2))
+        + np.where(col_steps == 0, grid[:, 1:, :], 0).sum(axis=(1, 2)))
+    largest = grid.max(axis=(1, 2))
+    return mono, empty, merges, largest
+
+
+def evaluate_boards(boards, table=None):
+    '''
+    Heuristic values of an array of packed boards, the same as calling
+    table.evaluate on each of them. table defaults to GameNode.table, and
+    only its weights are used. Returns an array of floats.
+    '''
+    table = table or GameNode.table
+    grid = unpack_boards(boards)
+    mono, empty, merges, largest = components(grid)
+    score = (table.available_weight*(empty/16)
+        + table.monotonicity_weight*(mono/48))
+    #Empty neighbors are equal too, but count 0, so boards without merges
+    #add nothing and are not divided by a zero largest exponent.
+    score += np.where(merges > 0,
+        table.merge_weight*(merges/np.maximum(largest, 1)), 0.0)
+    score += np.where(grid[:, 3, 3] >= largest, table.corner_weight, 0.0)
+    return score
+
+
+class BatchExpectimax(Expectimax):
+    '''
+    Expectimax that scores the leaves of the search in one batch. The tree
+    is first expanded as in Expectimax, keeping its shape as nested lists
+    and the leaf boards in self.frontier. evaluate_boards then scores the
+    frontier, and the values are backed up through the lists.
+
+    Nodes are not created for the last ply, their boards are collected
+    directly with GameNode.successor_boards.
+
+    The chosen move and the values are the same as with Expectimax. Since
+    values only exist after the whole tree is expanded, a cache is filled
+    for later searches but can not answer positions repeated within the
+    same search. With a heuristic other than GameNode.table, such as
+    the symmetric one, the frontier is scored one board at a time. A
+    cancelled search returns None, as no move is complete before the
+    frontier is scored.
+    '''
+    def __init__(self, cache=None, sink=None, verbose=False, prob_cutoff=0.0):
+        if np is None:
+            raise ImportError("BatchExpectimax needs numpy")
+        super().__init__(cache=cache, sink=sink, verbose=verbose, prob_cutoff=prob_cutoff)
+        self.frontier = []
+
+    def search(self, root, depth=3, token=None):
+        self.begin(depth, root, token)
+        self.evaluations = self.expand_roots([root])[0]
+        return self.finish(root)
+
+    def search_many(self, roots, depth=3, token=None):
+        '''
+        Searches several roots together, with one frontier for all of them,
+        and returns a list of (value, child) pairs for each root. The list
+        is empty for a root without moves. The stats cover all roots.
+        '''
+        self.begin(depth, roots[0], token)
+        evaluations = self.expand_roots(roots)
+        self.finish(roots[0])
+        return evaluations
+
+    def expand_roots(self, roots):
+        '''
+        Values are only known once the whole frontier is scored, so a
+        cancelled search has no completed moves, and every list is empty.
+        '''
+        try:
+            return self.expand_frontier(roots)
+        except SearchCancelled:
+            self.cancelled = True
+            self.frontier = []
+            return [[] for _ in roots]
+
+    def expand_frontier(self, roots):
+        self.frontier = []
+        trees = []
+        for root in roots:
+            self.stats.expanded[root.level] += 1
+            children = [] if root.is_state_terminal() else list(root.get_max_children())
+            trees.append((children, [self.expand(c, Player.MAX, 1.0) for c in children]))
+        values = self.evaluate_frontier()
+        self.frontier = []
+        return [list(zip([self.back_up(t, values) for t in subtrees], children))
+            for children, subtrees in trees]
+
+    def leaf(self, s):
+        self.frontier.append(s.state.bitboard)
+        return len(self.frontier) - 1
+
+    def expand(self, s, p, prob=1.0):
+        '''
+        Expands s the way Expectimax.value searches it. Returns the index of
+        a leaf in the frontier, a value found in the cache, or a list
+        [player, key, subtrees, weights] for an interior node.
+        '''
+        stats = self.stats
+        stats.expanded[s.level] += 1
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.checkpoint()
+        if s.terminal_state():
+            stats.leaves += 1
+            return self.leaf(s)
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(s.state_key(), s.remaining_depth(), p == Player.MIN)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return float(entry[0])
+        if prob < self.prob_cutoff:
+            stats.pruned += 1
+            stats.leaves += 1
+            return self.leaf(s)
+        if s.remaining_depth() == 0:
+            return self.expand_last(s, p, key)
+        if p == Player.MIN:
+            subtrees = [self.expand(c, Player.MAX, prob) for c in s.get_max_children()]
+            return [p, key, subtrees, None]
+        children = list(s.get_min_children())
+        weights = [c.probability(len(children)) for c in children]
+        subtrees = [self.expand(c, Player.MIN, prob*w) for c, w in zip(children, weights)]
+        return [p, key, subtrees, weights]
+
+    def expand_last(self, s, p, key):
+        '''
+        Expands a node whose children are all below the depth limit. Their
+        boards go straight into the frontier, without creating nodes.
+        '''
+        children = list(s.successor_boards(Player.MAX if p == Player.MIN else Player.MIN))
+        self.stats.expanded[s.level + 1] += len(children)
+        self.stats.leaves += len(children)
+        start = len(self.frontier)
+        self.frontier.extend(board for board, _, _ in children)
+        subtrees = list(range(start, len(self.frontier)))
+        if p == Player.MIN:
+            return [p, key, subtrees, None]
+        weights = [GameNode.tile_probability(tile, len(children)) for _, tile, _ in children]
+        return [p, key, subtrees, weights]
+
+    def evaluate_frontier(self):
+        if not self.frontier:
+            return []
+        if GameNode.heuristic is not GameNode.table:
+            return [GameNode.heuristic.evaluate(b) for b in self.frontier]
+        return evaluate_boards(self.frontier).tolist()
+
+    def back_up(self, tree, values):
+        if type(tree) is int:
+            return values[tree]
+        if type(tree) is float:
+            return tree
+        p, key, subtrees, weights = tree
+        child_values = [self.back_up(t, values) for t in subtrees]
+        if p == Player.MIN:
+            value = max(child_values)
+        else:
+            value = self.expectation(child_values, weights)
+        if key is not None:
+            self.cache.put(key, value)
+        return value
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("move_boards matches perform_action on " + str(check_moves(n)) + " boards")
@@ -0,0 +1,244 @@
+'''
+Benchmarks for the solver hot paths. Before anything is timed, the
+vectorized move generation is checked against the plain one (batch.py,
+when NumPy is available), and the run stops if they differ. Three groups
+are measured:
+
+    micro   - GameState and GameNode methods, in nanoseconds per call
+    search  - nodes per second of each solver at depths 2-5 on a fixed
+              corpus of boards
+    games   - complete self-play games with fixed seeds
+
+Results are written as JSON. Given a baseline file from an earlier run,
+every measurement is compared against it and regressions are reported:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json
+'''
+import argparse
+import json
+import random
+import sys
+import time
+import timeit
+
+import batch
+import model
+from model import GameState, GameNode, Game, Direction
+import selfplay
+
+#Fixed corpus: the sample boards from model.py, and boards from the
+#early, middle and late game.
+CORPUS = {
+    "sample": model.board,
+    "sample2": model.board2,
+    "early": [
+        0, 0, 0, 2,
+        0, 2, 0, 0,
+        0, 0, 4, 0,
+        0, 0, 0, 8,
+        ],
+    "middle": [
+        2, 0, 4, 0,
+        0, 8, 16, 4,
+        2, 16, 32, 64,
+        4, 32, 128, 256,
+        ],
+    "late": [
+        2, 4, 8, 2,
+        4, 16, 32, 4,
+        8, 64, 128, 256,
+        16, 512, 1024, 2048,
+        ],
+}
+
+#The solvers are the ones self-play knows, so bench_games can play them.
+SOLVERS = selfplay.SOLVERS
+
+
+def make_state(board):
+    state = GameState()
+    state.board = board
+    return state
+
+
+def full_heuristic_value(node):
+    '''
+    Nodes keep their heuristic components after the first evaluation, so
+    they are cleared to time a full evaluation, as for a new leaf.
+    '''
+    node.components = None
+    return node.get_heuristic_value()
+
+
+def run_checks(n):
+    '''
+    Differential checks of the fast paths, on n random boards. Exits with
+    an error if one fails, so a broken fast path is never benchmarked.
+    '''
+    checks = {}
+    if batch.np is not None:
+        try:
+            checks["move_boards"] = batch.check_moves(n)
+        except Exception as error:
+            print("Check failed: " + str(error))
+            sys.exit(1)
+    return checks
+
+
+def bench_micro(number):
+    '''
+    Time per call of the methods used for every search node, averaged over
+    the corpus.
+    '''
+    states = [make_state(b) for b in CORPUS.values()]
+    nodes = [GameNode(s) for s in states]
+    cases = {
+        "perform_action": lambda: [s.copy_state().perform_action(d)
+            for s in states for d in Direction],
+        "copy_state": lambda: [s.copy_state() for s in states],
+        "get_empty_tiles": lambda: [s.get_empty_tiles() for s in states],
+        "terminal_state": lambda: [s.terminal_state() for s in states],
+        "get_heuristic_value": lambda: [full_heuristic_value(n) for n in nodes],
+    }
+    #perform_action also pays for a copy, which is how the search uses it.
+    calls = {"perform_action": len(states)*4}
+    results = {}
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=number, repeat=3))
+        results[name] = seconds/(number*calls.get(name, len(states)))*1e9
+    return results
+
+
+def bench_search(depths, solver_names, repeat=3):
+    '''
+    Nodes per second of each solver and depth, over the whole corpus.
+    Tile values sampled by the search come from a fixed seed. Each search
+    is repeated, and the fastest run is kept to reduce noise.
+    '''
+    results = {}
+    for name in solver_names:
+        for depth in depths:
+            nodes = 0
+            cutoffs = 0
+            interior = 0
+            seconds = 0.0
+            for board in CORPUS.values():
+                best = float("inf")
+                for _ in range(repeat):
+                    Game.rng = random.Random(0)
+                    solver = SOLVERS[name]()
+                    root = GameNode(make_state(board))
+                    start = time.perf_counter()
+                    solver.search(root, depth)
+                    best = min(best, time.perf_counter() - start)
+                seconds += best
+                nodes += solver.stats.node_count()
+                cutoffs += solver.stats.cutoffs
+                interior += solver.stats.node_count() - solver.stats.leaves
+            results[name + "/d" + str(depth)] = {
+                "nodes": nodes,
+                "cutoff_rate": cutoffs/interior if interior else 0.0,
+                "seconds": seconds,
+                "nodes_per_sec": nodes/seconds if seconds else 0.0,
+            }
+    return results
+
+
+def bench_games(seeds, depth, solver_names):
+    '''
+    Complete games with fixed seeds, in this process.
+    '''
+    results = {}
+    for name in solver_names:
+        games = [selfplay.play_game(seed, name, depth) for seed in seeds]
+        seconds = sum(g["wall_time"] for g in games)
+        moves = sum(g["moves"] for g in games)
+        results[name + "/d" + str(depth)] = {
+            "seconds": seconds,
+            "moves": moves,
+            "moves_per_sec": moves/seconds if seconds else 0.0,
+            "score": sum(g["score"] for g in games),
+        }
+    return results
+
+
+def flatten(results):
+    '''
+    Pairs of (name, value, higher_is_better) for every measurement that is
+    compared against a baseline.
+    '''
+    for name, ns in results.get("micro", {}).items():
+        yield "micro/" + name, ns, False
+    for name, r in results.get("search", {}).items():
+        yield "search/" + name, r["nodes_per_sec"], True
+    for name, r in results.get("games", {}).items():
+        yield "games/" + name, r["moves_per_sec"], True
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Prints the change of every measurement found in both runs, and returns
+    the names of those that got worse by more than tolerance.
+    '''
+    old = {name: value for name, value, _ in flatten(baseline)}
+    regressions = []
+    for name, value, higher_is_better in flatten(results):
+        if name not in old or not old[name]:
+            continue
+        ratio = value/old[name]
+        speedup = ratio if higher_is_better else 1/ratio if ratio else float("inf")
+        flag = ""
+        if speedup < 1 - tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<32} {:>14.1f} {:>14.1f} {:>7.2f}x{}".format(
+            name, old[name], value, speedup, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2048 solver benchmarks")
+    parser.add_argument("--depths", default="2,3,4,5")
+    parser.add_argument("--solvers", default="alphabeta,alphabeta-ordered,expectimax")
+    parser.add_argument("--check-boards", type=int, default=20000)
+    parser.add_argument("--micro-number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--games", type=int, default=2)
+    parser.add_argument("--game-depth", type=int, default=2)
+    parser.add_argument("--skip", default="",
+        help="comma separated groups to skip: check, micro, search, games")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--save", default=None, help="write results as a new baseline")
+    parser.add_argument("--baseline", default=None, help="compare against this file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+        help="allowed slowdown before a measurement counts as a regression")
+    args = parser.parse_args()
+    skip = set(args.skip.split(","))
+    results = {"python": sys.version.split()[0]}
+    if "check" not in skip:
+        results["check"] = run_checks(args.check_boards)
+    if "micro" not in skip:
+        results["micro"] = bench_micro(args.micro_number)
+    if "search" not in skip:
+        depths = [int(d) for d in args.depths.split(",")]
+        results["search"] = bench_search(depths, args.solvers.split(","), args.repeat)
+    if "games" not in skip:
+        results["games"] = bench_games(range(args.games), args.game_depth,
+            args.solvers.split(","))
+    for path in (args.output, args.save):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+    if not args.output:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
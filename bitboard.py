@@ -0,0 +1,207 @@
+'''
+Packed 64-bit board representation used by GameState.
+
+The board is stored as a single integer holding 16 nibbles. Each nibble is
+the log2 of the tile value (0 for an empty slot), and slot i = x + 4*y is
+found at bit offset 4*i, so row y is the 16-bit chunk at offset 16*y.
+Moves are done with lookups into precomputed row transition tables, and
+UP/DOWN are done by transposing the board and moving LEFT/RIGHT.
+'''
+
+ROW_MASK = 0xFFFF
+NIBBLE_MASK = 0xF
+NIBBLE_LOW_BITS = 0x1111111111111111
+#Largest exponent a nibble can hold (2^15 = 32768). Two of these tiles
+#are never merged, since the result would not fit in a nibble.
+MAX_EXPONENT = 15
+
+#Same values as model.Direction, repeated to avoid a circular import.
+LEFT = 1
+RIGHT = 2
+UP = 3
+DOWN = 4
+
+
+def slide_line(line):
+    '''
+    Slides a line of four exponents towards index 0, and returns the new
+    line and the score (sum of created tile values). The rules are the
+    ones GameState.perform_action has always used: a tile is combined at
+    most once, and only one combine is done per line.
+    '''
+    line = list(line)
+    combined = False
+    score = 0
+    for i in range(4):
+        for j in range(i+1, 4):
+            if line[i] > 0 and line[j] > 0:
+                if (not combined and line[i] == line[j]
+                        and line[i] < MAX_EXPONENT):
+                    line[i] += 1
+                    line[j] = 0
+                    combined = True
+                    score += 1 << line[i]
+                break
+            elif line[i] == 0 and line[j] > 0:
+                line[i] = line[j]
+                line[j] = 0
+    return line, score
+
+
+def unpack_row(row):
+    return [(row >> (4*i)) & NIBBLE_MASK for i in range(4)]
+
+
+def pack_row(line):
+    return line[0] | (line[1] << 4) | (line[2] << 8) | (line[3] << 12)
+
+
+def reverse_row(row):
+    return (((row & 0xF) << 12) | ((row & 0xF0) << 4)
+        | ((row >> 4) & 0xF0) | ((row >> 12) & 0xF))
+
+
+def _build_row_tables():
+    left = [0]*(ROW_MASK+1)
+    right = [0]*(ROW_MASK+1)
+    score = [0]*(ROW_MASK+1)
+    for row in range(ROW_MASK+1):
+        line, s = slide_line(unpack_row(row))
+        result = pack_row(line)
+        rev = reverse_row(row)
+        left[row] = result
+        right[rev] = reverse_row(result)
+        score[row] = s
+    return left, right, score
+
+#ROW_LEFT[row] is the row after a LEFT move, ROW_RIGHT[row] after a RIGHT
+#move, and ROW_SCORE[row] the score gained by moving the row LEFT.
+ROW_LEFT, ROW_RIGHT, ROW_SCORE = _build_row_tables()
+
+
+def transpose(b):
+    '''
+    Mirrors the board along the main diagonal, so columns become rows.
+    '''
+    a1 = b & 0xF0F00F0FF0F00F0F
+    a2 = b & 0x0000F0F00000F0F0
+    a3 = b & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def rows(b):
+    return (b & ROW_MASK, (b >> 16) & ROW_MASK,
+        (b >> 32) & ROW_MASK, (b >> 48) & ROW_MASK)
+
+
+def _apply(table, b):
+    return (table[b & ROW_MASK]
+        | (table[(b >> 16) & ROW_MASK] << 16)
+        | (table[(b >> 32) & ROW_MASK] << 32)
+        | (table[(b >> 48) & ROW_MASK] << 48))
+
+
+def move_left(b):
+    return _apply(ROW_LEFT, b)
+
+
+def move_right(b):
+    return _apply(ROW_RIGHT, b)
+
+
+def move_up(b):
+    return transpose(_apply(ROW_LEFT, transpose(b)))
+
+
+def move_down(b):
+    return transpose(_apply(ROW_RIGHT, transpose(b)))
+
+_MOVES = (None, move_left, move_right, move_up, move_down)
+
+
+def execute_move(b, direction):
+    '''
+    Returns the board after moving in direction (LEFT, RIGHT, UP or DOWN).
+    '''
+    if direction < LEFT or direction > DOWN:
+        raise Exception("Not a valid direction")
+    return _MOVES[direction](b)
+
+
+def move_score(b, direction):
+    '''
+    Returns the score (sum of created tile values) a move would give.
+    '''
+    if direction == UP or direction == DOWN:
+        b = transpose(b)
+    if direction == RIGHT or direction == DOWN:
+        return sum(ROW_SCORE[reverse_row(r)] for r in rows(b))
+    return sum(ROW_SCORE[r] for r in rows(b))
+
+
+def count_empty(b):
+    '''
+    Number of empty slots, found by folding every nibble into its low bit.
+    '''
+    x = b | (b >> 1)
+    x |= x >> 2
+    return 16 - (x & NIBBLE_LOW_BITS).bit_count()
+
+
+def empty_indices(b):
+    return [i for i in range(16) if not (b >> (4*i)) & NIBBLE_MASK]
+
+
+def has_merges(b):
+    '''
+    True if any two neighboring tiles can be combined. Only meaningful for
+    a full board, where a line changes under a move exactly when it has
+    two equal neighbors.
+    '''
+    for r in rows(b):
+        if ROW_LEFT[r] != r:
+            return True
+    for r in rows(transpose(b)):
+        if ROW_LEFT[r] != r:
+            return True
+    return False
+
+
+def get_exponent(b, i):
+    return (b >> (4*i)) & NIBBLE_MASK
+
+
+def set_exponent(b, i, e):
+    shift = 4*i
+    return (b & ~(NIBBLE_MASK << shift)) | (e << shift)
+
+
+def to_exponent(value):
+    '''
+    Converts a tile value (0, 2, 4, 8, ...) to its exponent.
+    '''
+    if value == 0:
+        return 0
+    e = value.bit_length() - 1
+    if value != 1 << e or e < 1 or e > MAX_EXPONENT:
+        raise ValueError("Not a valid tile value: " + str(value))
+    return e
+
+
+def to_value(e):
+    return 1 << e if e else 0
+
+
+def from_list(board):
+    b = 0
+    for i, value in enumerate(board):
+        b |= to_exponent(value) << (4*i)
+    return b
+
+
+def to_list(b):
+    return [to_value((b >> (4*i)) & NIBBLE_MASK) for i in range(16)]
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from enum import Enum
+import symmetry
+
+class Bound(Enum):
+    '''
+    How a stored value relates to the true value of a position. Alpha beta
+    only knows a bound when a search was cut off or failed low.
+    '''
+    EXACT = 1
+    LOWER = 2
+    UPPER = 3
+
+class TranspositionTable(object):
+    '''
+    Cache of evaluated positions shared by the solvers. Entries are keyed on
+    (board, remaining depth, player to move) and hold (value, bound). The
+    table is bounded by a number of entries, or by an estimated number of
+    bytes, and evicts the least recently used entry when full.
+
+    With canonical set, boards are keyed on their canonical form under the
+    eight board symmetries, so symmetric positions share an entry. This is
+    only correct with a symmetric evaluation (GameNode.use_symmetric_heuristic).
+    With verify also set, lookups always miss, and every value the search
+    computes is checked against the entry a symmetric board left behind.
+    Lookups that find such an entry are counted in checks, not in hits.
+    Checking is only meaningful when the game tree is deterministic, ie
+    with Game.all_min_children set.
+    '''
+    #Allowed difference between values of symmetric positions. Children
+    #are visited in a different order, so float sums can differ slightly.
+    tolerance = 1e-6
+
+    #Rough size of one entry in CPython (int key, value tuple, float and
+    #the OrderedDict bookkeeping). Used to turn max_bytes into an entry cap.
+    entry_bytes = 200
+
+    def __init__(self, max_entries=None, max_bytes=None, canonical=False, verify=False):
+        if max_entries is None and max_bytes is None:
+            max_entries = 1000000
+        if max_bytes is not None:
+            by_bytes = max(1, max_bytes//self.entry_bytes)
+            max_entries = by_bytes if max_entries is None else min(max_entries, by_bytes)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.canonical = canonical or verify
+        self.verify = verify
+        self.pending = {}
+        self.checks = 0
+        self.verified = 0
+
+    def make_key(self, board, depth, max_to_move):
+        '''
+        Packs the key into a single integer, which hashes much faster than
+        a tuple. board is the packed 64-bit board.
+        '''
+        if self.canonical:
+            board = symmetry.canonical_board(board)
+        return (board << 8) | (depth << 1) | (1 if max_to_move else 0)
+
+    def get(self, key):
+        '''
+        Returns the (value, bound) pair stored for key, or None.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        if self.verify:
+            #Force the search down the non-canonical path, and compare
+            #when it stores its result.
+            self.misses += 1
+            self.checks += 1
+            self.pending[key] = entry
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, value, bound=Bound.EXACT):
+        if self.verify and key in self.pending:
+            self.check(self.pending.pop(key), value, bound)
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+        entries[key] = (value, bound)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def check(self, entry, value, bound):
+        '''
+        Raises an exception if a freshly computed value contradicts the
+        entry stored by a symmetric position.
+        '''
+        if bound is not Bound.EXACT:
+            return
+        cached, cached_bound = entry
+        if cached_bound is Bound.EXACT:
+            valid = abs(value - cached) <= self.tolerance
+        elif cached_bound is Bound.LOWER:
+            valid = value >= cached - self.tolerance
+        else:
+            valid = value <= cached + self.tolerance
+        if not valid:
+            raise Exception("Symmetric positions disagree: computed "
+                + str(value) + ", cached " + str(cached) + " (" + cached_bound.name + ")")
+        self.verified += 1
+
+    def clear(self):
+        self.pending.clear()
+        self.entries.clear()
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.checks = 0
+        self.verified = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits/lookups
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return ("TranspositionTable(entries=" + str(len(self))
+            + ", hits=" + str(self.hits)
+            + ", misses=" + str(self.misses)
+            + ", evictions=" + str(self.evictions)
+            + (", checks=" + str(self.checks) if self.verify else "") + ")")
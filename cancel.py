@@ -0,0 +1,59 @@
+import time
+
+class SearchCancelled(Exception):
+    '''
+    Raised inside a solver when its CancelToken is cancelled or its deadline
+    has passed. The solver catches it and returns the best answer among the
+    moves it completed.
+    '''
+    pass
+
+class CancelToken(object):
+    '''
+    Lets another thread stop a running search, or limits it to a deadline
+    (a time.perf_counter() value). The solvers check the token every
+    Solver.check_interval nodes, so a stop takes effect within a few
+    milliseconds. cancelled is only set by cancel(), so callers can tell
+    a stop from a deadline that passed.
+    '''
+    def __init__(self, deadline=None):
+        self.cancelled = False
+        self.deadline = deadline
+
+    def cancel(self):
+        self.cancelled = True
+
+    def limit(self, deadline):
+        '''
+        Moves the deadline forward to deadline, unless it is already earlier.
+        '''
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def expired(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def is_cancelled(self):
+        return self.cancelled or self.expired()
+
+class WorkerToken(CancelToken):
+    '''
+    CancelToken of a task running in a worker process. The parent cancels
+    its tasks by moving a shared counter (a multiprocessing.Value, handed to
+    the workers by the pool initializer) past the generation the tasks were
+    submitted in. Tasks of later searches are not affected.
+    '''
+    def __init__(self, counter, generation):
+        super().__init__()
+        self.counter = counter
+        self.generation = generation
+
+    def is_cancelled(self):
+        return self.counter.value != self.generation
+
+def cancel_generation(counter):
+    '''
+    Cancels the worker tasks submitted in the current generation of counter.
+    '''
+    with counter.get_lock():
+        counter.value += 1
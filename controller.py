@@ -1,15 +1,70 @@
 from model import GameState, Direction, GameNode, Game
-from search import AlphaBetaSearch
+from abstractnode import Node, Player
+from search import AlphaBetaSearch, IterativeDeepening
+from cancel import CancelToken
+from environment import GameEnvironment
+from sink import NullSink
+import bitboard
+import queue
 import sys
+import threading
 import time
 
 class GameController(object):
-    def __init__(self, display, solver=None):
-        self.model = GameState(root=True)
-        self.display = display
+    def __init__(self, snapshot_sink=None, solver=None, environment=None):
+        #The environment owns the random tile spawns. Give it a seed to
+        #make a game reproducible.
+        self.environment = environment or GameEnvironment()
+        self.environment.activate()
+        self.model = self.environment.new_state()
+        #Board snapshots are sent to the snapshot sink after every move, see
+        #sink.py. Without one they are dropped.
+        self.snapshot_sink = NullSink() if snapshot_sink is None else snapshot_sink
         self.running = False
         self.plies = 4
-        self.display.event({"state": self.model.create_representation()})
+        #Optional pause between moves in seconds, for watching the game.
+        #Without one the solver runs at full speed, paced only by a snapshot
+        #sink that blocks.
+        self.delay = 0
+        self.score = 0
+        self.moves = 0
+        self.nodes = 0
+        self.searched_nodes = 0
+        #Per move time budget in milliseconds. If set, the solver searches
+        #with iterative deepening instead of to a fixed number of plies.
+        self.time_limit = None
+        self.searched_depth = None
+        #Optional DepthPolicy consulted before each search, and the choice
+        #it made for the latest move.
+        self.depth_policy = None
+        self.depth_choice = None
+        #With reuse_tree set, the subtree below the chosen move and the
+        #actual spawn is kept for the next search. reused_nodes is the size
+        #of the subtree the latest search started from, reused the total.
+        self.reuse_tree = False
+        self.next_root = None
+        self.reused_nodes = 0
+        self.reused = 0
+        #With pondering set, the next move is searched in a background
+        #thread while the controller waits between moves. ponder_hits counts
+        #the moves answered by such a search.
+        self.pondering = False
+        self.ponder_thread = None
+        self.ponder_jobs = queue.Queue()
+        self.ponder_done = threading.Event()
+        self.ponder_pending = False
+        self.pondered = None
+        self.ponder_hits = 0
+        #Token of the running search, so it can be stopped from another
+        #thread. search_stopped tells if the latest search was stopped.
+        #lock guards what the ponder thread and the Tk thread share: the
+        #token, the settings in search_key, the board and the pondered
+        #result.
+        self.lock = threading.Lock()
+        self.token = None
+        self.restart_search = False
+        self.search_stopped = False
+        self.send_state_snapshot()
         if not solver: self.solver = AlphaBetaSearch()
         else: self.solver=solver
 
@@ -19,19 +74,263 @@ class GameController(object):
         pruning or expectimax
         '''
         Game.all_min_children = all_min_children
+        #Solvers owning worker processes release them when replaced.
+        if hasattr(self.solver, "close"):
+            self.solver.close()
         self.solver = solver
 
+    def set_time_limit(self, time_limit):
+        '''
+        Sets the time budget per move in milliseconds. None returns to
+        searching a fixed number of plies.
+        '''
+        self.time_limit = time_limit
+
+    def set_depth_policy(self, policy):
+        '''
+        Sets a DepthPolicy that picks the depth for each move. None returns
+        to the fixed number of plies.
+        '''
+        self.depth_policy = policy
+        self.depth_choice = None
+
+    def set_tree_reuse(self, reuse):
+        '''
+        Keeps the searched tree in memory (Node.retain_tree), so the part
+        below the move that was made and the tile that was spawned can be
+        searched again without being generated again.
+        '''
+        self.reuse_tree = reuse
+        Node.retain_tree = reuse
+        self.next_root = None
+
+    def set_pondering(self, pondering):
+        '''
+        Turns pondering on or off. Pondering only happens during the delay
+        between moves, so it needs a delay above 0. The delay is 0 unless
+        set, so pondering does nothing on its own.
+        '''
+        self.pondering = pondering
+
+    def set_plies(self, plies):
+        '''
+        Changes the search depth. A running search is restarted at the new
+        depth.
+        '''
+        with self.lock:
+            self.plies = plies
+            if self.token is not None:
+                self.restart_search = True
+                self.token.cancel()
+
+    def search(self, node):
+        '''
+        Finds the best child of node with the current solver, either to a
+        fixed depth or within the time budget. A depth policy, if set,
+        replaces the fixed depth, and caps the depth of timed searches.
+        The search can be stopped by stop_solving, which sets
+        search_stopped, and is restarted by set_plies.
+        '''
+        result = self.find_move(node)
+        self.use_result(result)
+        return result["child"]
+
+    def find_move(self, node):
+        '''
+        Runs the search and returns its result as a dict, without changing
+        the controller, so the ponder thread can run it too. use_result
+        takes the result over.
+        '''
+        while True:
+            token = CancelToken()
+            with self.lock:
+                self.restart_search = False
+                self.token = token
+                key = self.search_key()
+                depth = self.plies
+            result = self.run_search(node, depth, token)
+            with self.lock:
+                restart = token.cancelled and self.restart_search
+                if not restart:
+                    self.token = None
+            if not restart:
+                break
+        result["key"] = key
+        result["stopped"] = token.cancelled
+        return result
+
+    def use_result(self, result):
+        self.searched_depth = result["depth"]
+        self.searched_nodes = result["nodes"]
+        self.search_stopped = result["stopped"]
+        if result["depth_choice"] is not None:
+            self.depth_choice = result["depth_choice"]
+
+    def run_search(self, node, depth, token):
+        depth_choice = None
+        if self.depth_policy:
+            depth_choice = self.depth_policy.choose(node.state)
+            depth = depth_choice["depth"]
+        if self.time_limit:
+            deepening = IterativeDeepening(self.solver, self.time_limit)
+            if self.depth_policy:
+                deepening.max_depth = depth
+            selected_child = deepening.search(node, token=token)
+            return {"child": selected_child, "depth": deepening.completed_depth,
+                "nodes": deepening.nodes, "depth_choice": depth_choice}
+        selected_child = self.solver.search(node, depth, token)
+        return {"child": selected_child, "depth": depth,
+            "nodes": self.solver.stats.node_count(), "depth_choice": depth_choice}
+
     def action(self, direction):
         '''
-        Method will do a move, and send a model representation to the display.
-        Ideal for manually solving 2048 game. action can be called inside 
-        key listener functions.
+        Method will do a move, and send a model representation to the
+        snapshot sink. Ideal for manually solving 2048 game. action can be
+        called inside key listener functions.
         '''
-        moved = self.model.perform_action(direction)
-        self.display.event({"state": self.model.create_representation()})
+        with self.lock:
+            score = bitboard.move_score(self.model.bitboard, direction.value)
+            moved = self.model.perform_action(direction)
+            if moved:
+                self.score += score
+                self.moves += 1
+        self.send_state_snapshot()
         if moved:
-            self.model.set_random_tile()
-            self.display.event({"state": self.model.create_representation()})
+            with self.lock:
+                self.environment.spawn(self.model)
+            self.send_state_snapshot()
+
+    def step(self):
+        '''
+        The solver finds the best move for the player, and a random tile
+        is placed in a random empty slot afterwards. Snapshots of both
+        boards are sent to the snapshot sink. Returns False if no move was
+        found, ie the game is over, or if the search was stopped. A search that
+        runs out of time before any move completed falls back to
+        fallback_move.
+        '''
+        pondered = self.join_ponder()
+        if pondered is not None:
+            selected_child = pondered[0]
+            self.ponder_hits += 1
+        else:
+            selected_child = self.search(self.root_node())
+        self.nodes += self.searched_nodes
+        if self.search_stopped:
+            return False
+        if not selected_child:
+            if self.model.terminal_state():
+                return False
+            selected_child = self.fallback_move()
+        with self.lock:
+            self.score += bitboard.move_score(self.model.bitboard, selected_child.move.value)
+            self.moves += 1
+            self.model = selected_child.state
+        self.send_state_snapshot()
+        with self.lock:
+            self.environment.spawn(self.model)
+        self.send_state_snapshot()
+        if self.reuse_tree:
+            self.next_root = self.find_reusable(selected_child)
+        return True
+
+    def fallback_move(self):
+        '''
+        The child of the current board with the best heuristic value, for
+        when the search found no move in time.
+        '''
+        children = GameNode(self.model).generate_successors(Player.MAX)
+        return max(children, key=lambda child: child.get_heuristic_value())
+
+    def root_node(self):
+        '''
+        The node to search from: the subtree kept from the previous search
+        if there is one for the current board, otherwise a new node.
+        '''
+        node = self.next_root
+        self.next_root = None
+        self.reused_nodes = 0
+        if node is None or node.state.bitboard != self.model.bitboard:
+            return GameNode(self.model)
+        self.reused_nodes = node.make_root()
+        self.reused += self.reused_nodes
+        self.model = node.state
+        return node
+
+    def search_key(self):
+        '''
+        What a search result depends on. A pondered result is only used if
+        nothing in it changed while the search ran. Called with lock held.
+        '''
+        return (self.model.bitboard, self.solver, self.plies, self.time_limit,
+            self.depth_policy)
+
+    def ponder(self):
+        '''
+        Starts searching the current board in the background. The tile of
+        the previous move has already been spawned, so there is nothing to
+        guess: the search is the one the next step would run. The controller
+        thread only sleeps meanwhile, so the two never search at the same
+        time. The ponder thread is started once and then waits for jobs,
+        since starting a thread per move holds up the controller thread
+        until the new thread gives up the GIL.
+        '''
+        if self.ponder_thread is None:
+            self.ponder_thread = threading.Thread(target=self.ponder_loop, daemon=True)
+            self.ponder_thread.start()
+        node = self.root_node()
+        with self.lock:
+            self.pondered = None
+        self.ponder_done.clear()
+        self.ponder_pending = True
+        self.ponder_jobs.put(node)
+
+    def ponder_loop(self):
+        '''
+        Runs the ponder searches. The result is left in pondered, for
+        join_ponder to take over. An error in a search is kept for
+        join_ponder to raise, so the thread lives on for the next move.
+        '''
+        while True:
+            node = self.ponder_jobs.get()
+            try:
+                pondered = self.find_move(node)
+            except Exception as error:
+                pondered = error
+            with self.lock:
+                self.pondered = pondered
+            self.ponder_done.set()
+
+    def join_ponder(self):
+        '''
+        Waits for the ponder search, if one is running. Returns a tuple
+        holding its best child if it searched the current board with the
+        current settings and was not stopped, otherwise None. An error
+        raised by the ponder search is raised here, in the controller thread.
+        '''
+        if not self.ponder_pending:
+            return None
+        self.ponder_done.wait()
+        self.ponder_pending = False
+        with self.lock:
+            pondered, self.pondered = self.pondered, None
+            key = self.search_key()
+        if isinstance(pondered, Exception):
+            raise pondered
+        if pondered is None or pondered["stopped"] or pondered["key"] != key:
+            return None
+        self.use_result(pondered)
+        return (pondered["child"],)
+
+    def find_reusable(self, selected_child):
+        '''
+        Returns the child of selected_child for the tile that was actually
+        spawned, if the previous search generated it.
+        '''
+        for child in selected_child.children or ():
+            if child.state.bitboard == self.model.bitboard:
+                return child
+        return None
 
     def start_solving(self):
         '''
@@ -39,25 +338,29 @@ class GameController(object):
         the state is not terminal. For each iteration, the solver
         (minmax/expectimax) will find the best move for the player, place 
         a random tile in a random empty slot on the board, and send snapshots
-        containing board representations to the display.
+        containing board representations to the snapshot sink.
         '''
         self.running = True
         while self.running: #or not self.model.terminal_state()
-            node = GameNode(self.model)
-            selected_child = self.solver.search(node, self.plies)
-            #sys.exit(0)
-            if not selected_child:
-                print(max(node.state.board))
+            if not self.step():
+                if not self.search_stopped:
+                    print(max(self.model.board))
                 self.running = False
                 break
-            self.model = selected_child.state
-            self.send_state_snapshot()
-            self.model.set_random_tile()
-            self.send_state_snapshot()
-            time.sleep(0.04)
+            if self.delay:
+                if self.pondering:
+                    self.ponder()
+                time.sleep(self.delay)
     
     def stop_solving(self):
-        self.running = False
+        '''
+        Stops the solver loop, and cancels a running search, including one
+        pondering the next move.
+        '''
+        with self.lock:
+            self.running = False
+            if self.token is not None:
+                self.token.cancel()
 
     def set_new_board(self, board):
         if Game.nr_of_tiles == len(board):
@@ -66,4 +369,4 @@ class GameController(object):
             self.send_state_snapshot()
 
     def send_state_snapshot(self):
-        self.display.event({"state": self.model.create_representation()})
\ No newline at end of file
+        self.snapshot_sink.emit({"state": self.model.create_representation()})
\ No newline at end of file
@@ -2,7 +2,8 @@ from tkinter import *
 from tkinter import ttk
 from enum import Enum
 from math import fabs, floor
-from collections import deque
+from sink import QueueSink
+import time
 
 #Subclass of the tkinters Canvas object. Contains methods
 #for setting a graph model and drawing a graph, and changing
@@ -10,9 +11,20 @@ from collections import deque
 class PixelDisplay(Canvas):
     cWi = 500
     cHi = 500
+    #Frames drawn per second, at most.
+    fps = 25
+    #Snapshots kept waiting to be drawn, and what happens when the solver
+    #runs ahead and the queue is full, see sink.QueueSink. The default
+    #drops the oldest, so memory stays bounded and the solver never waits.
+    queue_size = 256
+    queue_policy = "drop_oldest"
+    #Seconds the display may lag behind the solver. Older snapshots are
+    #skipped, so the display catches up instead of falling further behind.
+    max_lag = 0.5
 
     def __init__(self, parent):
-        self.queue = deque([])
+        #The snapshot sink of the GameController, see gui.py.
+        self.queue = QueueSink(self.queue_size, self.queue_policy)
         self.model = None
         self.width = self.cWi
         self.height = self.cHi
@@ -36,19 +48,22 @@ class PixelDisplay(Canvas):
         in the queue. The queue of timeslices allow the algorithm to run at 
         full speed while the display is delaying the rendering, so it is easy to
         watch it's progress
-        
+
         Draw will pop a timeslice from the draw queue, and 
         use it's data to draw the partial solution on screen.
-        Each cell will be assigned a color, and a arrow/point to indicate
-        direction the cell gives its output.
+        At most fps timeslices are drawn per second. Timeslices queued more
+        than max_lag seconds ago are skipped, except the newest one, so a
+        fast solver is shown as it is now rather than as it was.
         '''
-        if len(self.queue)>0:
-            timeslice = self.queue.popleft()
-            if timeslice:
-                self.draw_model(timeslice)
+        start = time.perf_counter()
+        timeslice = self.queue.poll(self.max_lag)
+        if timeslice:
+            self.draw_model(timeslice)
 
         if not self.stopped or len(self.queue) > 0:
-            self.after(60, self.draw)
+            frame = 1000.0/self.fps
+            spent = (time.perf_counter() - start)*1000
+            self.after(max(1, int(frame - spent)), self.draw)
 
     def colorize_item(self, item, color):
         self.itemconfig(item, fill=color)
@@ -59,10 +74,13 @@ class PixelDisplay(Canvas):
         y = self.translate_y(y_pos)
         w = self.translate_y(x_pos + w)
         h = self.translate_y(y_pos + h)
+        font = self.label_font(text)
+        return self.create_text((x+w)/2, (y+h)/2, text=text, tags=t, fill=c, font=font)
+
+    def label_font(self, text):
         penalty = len(text)
         font_size = 35 -penalty*2
-        font = ("Helvetica", font_size, "bold")
-        self.create_text((x+w)/2, (y+h)/2, text=text, tags=t, fill=c, font=font)
+        return ("Helvetica", font_size, "bold")
 
     #Method for drawing a graph from a ProblemModel. 
     #Draws the model and add tags so individual nodes can later
@@ -113,12 +131,14 @@ class PixelDisplay(Canvas):
         y = self.translate_y(y_pos)+padding
         w = self.translate_x(x_pos+width)-padding
         h = self.translate_y(y_pos+height)-padding
-        self.create_oval(x, y, x +rad, y + rad, fill=color, tag=tags, width=1, outline=line)
-        self.create_oval(w -rad, y, w, y + rad, fill=color, tag=tags, width=1, outline=line)
-        self.create_oval(x, h-rad, x +rad, h, fill=color, tag=tags, width=1, outline=line)
-        self.create_oval(w-rad, h-rad, w , h, fill=color, tag=tags, width=1, outline=line)
-        self.create_rectangle(x + (rad/2.0), y, w-(rad/2.0), h, fill=color, tag=tags, width=0)
-        self.create_rectangle(x , y + (rad/2.0), w, h-(rad/2.0), fill=color, tag=tags, width=0)
+        return [
+            self.create_oval(x, y, x +rad, y + rad, fill=color, tag=tags, width=1, outline=line),
+            self.create_oval(w -rad, y, w, y + rad, fill=color, tag=tags, width=1, outline=line),
+            self.create_oval(x, h-rad, x +rad, h, fill=color, tag=tags, width=1, outline=line),
+            self.create_oval(w-rad, h-rad, w , h, fill=color, tag=tags, width=1, outline=line),
+            self.create_rectangle(x + (rad/2.0), y, w-(rad/2.0), h, fill=color, tag=tags, width=0),
+            self.create_rectangle(x , y + (rad/2.0), w, h-(rad/2.0), fill=color, tag=tags, width=0),
+            ]
 
     def set_dimension(self, max_x, max_y, min_x, min_y):
         self.w = fabs(min_x) + max_x
@@ -140,9 +160,6 @@ class PixelDisplay(Canvas):
         self.config(width=self.width, height=self.height)
         self.scale("all",0,0,wscale,wscale)
 
-    def event(self, data):
-        self.queue.append(data)
-
 class Game2048Display(PixelDisplay):
     
     def __init__(self, parent):
@@ -154,29 +171,53 @@ class Game2048Display(PixelDisplay):
         self.draw_board()
 
     def draw_board(self):
+        '''
+        Draws the background, and the items of a piece in every cell. The
+        piece items are kept and hidden while the cell is empty, so
+        draw_model only has to change the cells that changed.
+        '''
         self.reset()
         self.draw_pixel(0, 0, self.dim, self.dim, self.bg, tag="bg")
         for i in range(self.dim):
             for j in range(self.dim):
                 self.draw_rounded(i,j, 1, 1,  self.empty_cell, padding=8, line=self.bg, tags="bg")
-        #self.draw_piece("B1", 3,2, 2)
-        #self.draw_piece("B2",3,3, 4)
-        #self.draw_piece("B3",1,1, 32)
+        #Tile shown in each cell, and the canvas items of its piece.
+        self.shown = [0]*(self.dim*self.dim)
+        self.pieces = []
+        for i in range(self.dim*self.dim):
+            x = i%self.dim
+            y = floor(i/self.dim)
+            shapes = self.draw_rounded(x,y, 1, 1,  self.empty_cell, padding=8,
+                line=self.bg, tags="Piece")
+            label = self.draw_label(x,y, 1,1, "", t="Piece")
+            for item in shapes + [label]:
+                self.itemconfig(item, state=HIDDEN)
+            self.pieces.append((shapes, label))
 
     def draw_model(self, timeslice):
         if "state" in timeslice and timeslice["state"]:
             state = timeslice["state"]
-            #print(state)
-            self.delete("Piece")
             for i,tile in enumerate(state):
-                if tile>0:
-                    x = i%4
-                    y = floor(i/4)
-                    self.draw_piece("Piece", x, y, tile)
-
-    def draw_piece(self, piece_id, x, y, piece_type):
-        self.draw_rounded(x,y, 1, 1,  Color.get(piece_type), padding=8, line=self.bg, tags=piece_id)
-        self.draw_label( x,y, 1,1, str(piece_type), t=piece_id, c=Color.get_font_color(piece_type))
+                if tile != self.shown[i]:
+                    self.draw_piece(i, tile)
+
+    def draw_piece(self, i, piece_type):
+        '''
+        Shows piece_type in cell i, or hides the piece if it is 0.
+        '''
+        self.shown[i] = piece_type
+        shapes, label = self.pieces[i]
+        if piece_type == 0:
+            for item in shapes + [label]:
+                self.itemconfig(item, state=HIDDEN)
+            return
+        color = Color.get(piece_type)
+        for item in shapes:
+            self.itemconfig(item, fill=color, state=NORMAL)
+        text = str(piece_type)
+        self.itemconfig(label, text=text, font=self.label_font(text),
+            fill=Color.get_font_color(piece_type), state=NORMAL)
+
 #A switch case for retriving a color. A somewhat lazy approch
 #since there there is a limitied number of colors in the 
 #dictionary.
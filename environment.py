@@ -0,0 +1,46 @@
+import random
+from model import GameState, Game
+
+def split_seeds(seed, n):
+    '''
+    Derives n independent game seeds from one master seed. Game i always
+    gets the same seed, however the games are spread over processes.
+    '''
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(n)]
+
+class GameEnvironment(object):
+    '''
+    Owns the randomness of one game, so a game can be replayed from its seed.
+    Tile spawns are drawn from one stream, and the tile values sampled by
+    the search (GameNode.generate_successors when not all MIN children are
+    made) from a second one. The second stream is installed as Game.rng by
+    activate(), which the controller does before playing.
+    '''
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.search_rng = random.Random(self.rng.getrandbits(64))
+
+    def activate(self):
+        Game.rng = self.search_rng
+
+    def new_state(self):
+        '''
+        Returns the start board, with two random tiles.
+        '''
+        state = GameState()
+        self.spawn(state)
+        self.spawn(state)
+        return state
+
+    def spawn(self, state):
+        '''
+        Places a 2 or 4 in a random empty slot of state, picked directly by
+        index. Returns the (slot index, tile) pair.
+        '''
+        empty = state.get_empty_tiles()
+        i = empty[self.rng.randrange(len(empty))]
+        tile = state.pick_random(self.rng)
+        state.set(i, tile)
+        return i, tile
@@ -64,7 +64,7 @@ class AppUI(Frame):
             d = CustomDialog(master)
             master.wait_window(d.top)
             value = int(d.result.strip())
-            app.controller.plies = value
+            app.controller.set_plies(value)
 
         try:
             self.master.config(menu=self.menubar)
@@ -126,7 +126,11 @@ root.columnconfigure(0, weight=1)
 root.rowconfigure(0, weight=1)
 root.title("2048")
 app = AppUI(root)
-app.controller = GameController(app.visualizer)
+app.controller = GameController(snapshot_sink=app.visualizer.queue)
+#Pause between moves, so the game can be followed on screen.
+app.controller.delay = 0.04
+#Search the next move while the display shows the current one.
+app.controller.set_pondering(True)
 app.visualizer.set_model(app.controller.model)
 app.visualizer.start()
 #root.bind('<Return>', solve)
@@ -0,0 +1,188 @@
+import bitboard
+
+class HeuristicTable(object):
+    '''
+    Table driven version of GameNode.get_heuristic_value. Every heuristic
+    component is a sum over the rows and columns of the board, except that
+    merges are scaled by, and the corner bonus compared against, the largest
+    tile. A score for each of the 65536 possible rows is therefore computed
+    once, and evaluating a board is a lookup per row and column of the
+    board plus a sum.
+
+    The sums are kept as integer components, (monotonicity, empty slots,
+    merges, largest exponent), so they can be carried from a node to its
+    children and updated for the lines that changed only. See spawn and
+    slide. The score is always computed from the components, so an updated
+    node gets exactly the same value as a full evaluation.
+    '''
+    def __init__(self, weights):
+        self.weights = dict(weights)
+        self.available_weight = weights["available"]
+        self.corner_weight = weights["corner"]
+        self.monotonicity_weight = weights["monotonicity"]
+        self.merge_weight = weights["merges"]
+        size = bitboard.ROW_MASK + 1
+        #Only rows count empty slots, so they are counted once. Rows and
+        #columns both count monotonicity and merges.
+        self.mono_table = [0]*size
+        self.empty_table = [0]*size
+        self.merge_table = [0]*size
+        self.max_table = [0]*size
+        for row in range(size):
+            line = bitboard.unpack_row(row)
+            self.mono_table[row] = self.line_monotonicity(line)
+            self.empty_table[row] = line.count(0)
+            self.merge_table[row] = self.line_merges(line)
+            self.max_table[row] = max(line)
+        self.score_bounds = None
+
+    def bounds(self):
+        '''
+        Returns (lower, upper), bounds on the score of any board. The merge
+        term of a line is divided by the largest tile on the board, which is
+        at least the largest tile of the line, so each line is bounded on
+        its own and the bounds of the eight lines are added up.
+        '''
+        if self.score_bounds is None:
+            self.score_bounds = self.compute_bounds()
+        return self.score_bounds
+
+    def compute_bounds(self):
+        row_low = row_high = col_low = col_high = None
+        for row in range(bitboard.ROW_MASK + 1):
+            merges = 0
+            if self.merge_table[row]:
+                merges = self.merge_weight*self.merge_table[row]/self.max_table[row]
+            merge_low, merge_high = min(0, merges), max(0, merges)
+            c = self.monotonicity_weight*self.mono_table[row]/48
+            r = c + self.available_weight*self.empty_table[row]/16
+            if row_low is None:
+                row_low, row_high = r + merge_low, r + merge_high
+                col_low, col_high = c + merge_low, c + merge_high
+            row_low = min(row_low, r + merge_low)
+            row_high = max(row_high, r + merge_high)
+            col_low = min(col_low, c + merge_low)
+            col_high = max(col_high, c + merge_high)
+        lower = 4*row_low + 4*col_low + min(0, self.corner_weight)
+        upper = 4*row_high + 4*col_high + max(0, self.corner_weight)
+        return lower, upper
+
+    def line_monotonicity(self, line):
+        '''
+        Same measure as GameNode.monotonicity, for a single line. Later
+        positions in the line are weighted higher.
+        '''
+        score = 0
+        for j in range(1, 4):
+            if line[j-1] < line[j]:
+                score += j
+            elif line[j-1] > line[j]:
+                score -= j
+        return score
+
+    def line_merges(self, line):
+        '''
+        Sum of the exponents of neighboring equal tiles in a line.
+        GameNode.merge_possibilities divides this by the largest exponent.
+        '''
+        score = 0
+        for j in range(1, 4):
+            if line[j-1] == line[j] and line[j] > 0:
+                score += line[j]
+        return score
+
+    def lines(self, b):
+        '''
+        Returns (rows, cols), the four rows and four columns of the packed
+        board b as packed lines.
+        '''
+        mask = bitboard.ROW_MASK
+        t = bitboard.transpose(b)
+        return ((b & mask, (b >> 16) & mask, (b >> 32) & mask, b >> 48),
+            (t & mask, (t >> 16) & mask, (t >> 32) & mask, t >> 48))
+
+    def components(self, b):
+        '''
+        Returns the components of the packed board b, computed from scratch.
+        '''
+        mono = self.mono_table
+        merge = self.merge_table
+        largest = self.max_table
+        (r0, r1, r2, r3), (c0, c1, c2, c3) = self.lines(b)
+        return (
+            mono[r0] + mono[r1] + mono[r2] + mono[r3]
+                + mono[c0] + mono[c1] + mono[c2] + mono[c3],
+            self.empty_table[r0] + self.empty_table[r1]
+                + self.empty_table[r2] + self.empty_table[r3],
+            merge[r0] + merge[r1] + merge[r2] + merge[r3]
+                + merge[c0] + merge[c1] + merge[c2] + merge[c3],
+            max(largest[r0], largest[r1], largest[r2], largest[r3]))
+
+    def score(self, b, components):
+        '''
+        Returns the heuristic value of the packed board b, given its
+        components. Weighted the same way as the component methods of
+        GameNode.
+        '''
+        mono, empty, merges, max_exponent = components
+        score = (self.available_weight*(empty/16)
+            + self.monotonicity_weight*(mono/48))
+        if merges:
+            score += self.merge_weight*(merges/max_exponent)
+        #The bottom right slot is the last nibble of the board.
+        if b >> 60 >= max_exponent:
+            score += self.corner_weight
+        return score
+
+    def evaluate(self, b):
+        '''
+        Returns the heuristic value of the packed board b.
+        '''
+        return self.score(b, self.components(b))
+
+    def spawn(self, components, rows, cols, i, exponent):
+        '''
+        Components of the board after a tile with the given exponent is
+        placed in the empty slot i. rows and cols are the lines of the board
+        before, see lines. Only the row and the column of the slot change.
+        '''
+        mono = self.mono_table
+        merge = self.merge_table
+        x, y = i & 3, i >> 2
+        row, col = rows[y], cols[x]
+        new_row = row | (exponent << 4*x)
+        new_col = col | (exponent << 4*y)
+        m, empty, merges, max_exponent = components
+        return (
+            m + mono[new_row] - mono[row] + mono[new_col] - mono[col],
+            empty - 1,
+            merges + merge[new_row] - merge[row] + merge[new_col] - merge[col],
+            max(max_exponent, exponent))
+
+    def slide(self, components, rows, cols, b):
+        '''
+        Components of the packed board b after a move, from the components
+        and the lines of the board before the move. Only the rows and
+        columns that changed are updated. A move along the rows can change
+        every column, so the columns are always compared, but unchanged
+        lines cost a comparison only. Tiles only grow when they merge, so
+        the largest exponent never goes down.
+        '''
+        mono = self.mono_table
+        merge = self.merge_table
+        empty_table = self.empty_table
+        largest = self.max_table
+        m, empty, merges, max_exponent = components
+        new_rows, new_cols = self.lines(b)
+        for old, new in zip(rows, new_rows):
+            if old != new:
+                m += mono[new] - mono[old]
+                empty += empty_table[new] - empty_table[old]
+                merges += merge[new] - merge[old]
+                if largest[new] > max_exponent:
+                    max_exponent = largest[new]
+        for old, new in zip(cols, new_cols):
+            if old != new:
+                m += mono[new] - mono[old]
+                merges += merge[new] - merge[old]
+        return m, empty, merges, max_exponent
@@ -2,6 +2,9 @@ import random
 import copy
 from enum import Enum
 from abstractnode import Node,Player
+from heuristic import HeuristicTable
+from symmetry import SymmetricHeuristic
+import bitboard
 import math
 
 class Game(object):
@@ -14,34 +17,59 @@ class Game(object):
     dim = 4
     nr_of_tiles = 16
     all_min_children = False
+    #Random source for tile values sampled during search. Anything with a
+    #random() method works, see GameEnvironment.activate.
+    rng = random
+    heuristic_weights = {
+        "available": 4500,
+        "corner": 500,
+        "monotonicity": 4000,
+        "merges": 1000,
+    }
 
 class GameState(object):
     '''
     If the GameState is root, a board has to be constructed.
     Otherwise the GameState has been copied, start conditions does not apply.
+    The board is kept packed in a single integer, see bitboard.py. The
+    board property gives the familiar list of 16 tile values.
     '''
+    __slots__ = ("bitboard",)
+    #Number of states created so far, see GameNode.allocation_count.
+    allocations = [0]
+
     def __init__(self, root=False):
-        self.board = []
-        self.nr_empty_tile = Game.nr_of_tiles
+        GameState.allocations[0] += 1
+        self.bitboard = 0
         if root:
-            for i in range(Game.dim*Game.dim):
-                self.board.append(0)
             self.set_random_tile()
             self.set_random_tile()
 
-    def set_random_tile(self):
+    @property
+    def board(self):
+        return bitboard.to_list(self.bitboard)
+
+    @board.setter
+    def board(self, board):
+        self.bitboard = bitboard.from_list(board)
+
+    @property
+    def nr_empty_tile(self):
+        return bitboard.count_empty(self.bitboard)
+
+    def set_random_tile(self, rng=None):
         '''
         Will populate a random empty slot with a 2 or 4 tile decided by
-        the 2048 spawn probability. 
+        the 2048 spawn probability. rng defaults to Game.rng.
         '''
+        rng = rng or Game.rng
         empty = self.get_empty_tiles()
-        random.shuffle(empty)
-        i = empty.pop()
-        n = self.pick_random()
+        i = empty[rng.randrange(len(empty))]
+        n = self.pick_random(rng)
         self.set(i, n)
 
-    def pick_random(self):
-        r, s = random.random(), 0
+    def pick_random(self, rng=None):
+        r, s = (rng or Game.rng).random(), 0
         for num in Game.spawn_probability:
             s += num[1]
             if s >= r:
@@ -55,30 +83,26 @@ class GameState(object):
         return (Game.dim*y)+x
 
     def get(self, x, y):
-        return self.board[(Game.dim*y)+x]
+        return bitboard.to_value(
+            bitboard.get_exponent(self.bitboard, (Game.dim*y)+x))
 
     def set(self, i, value):
-        self.board[i] = value
-        self.nr_empty_tile -= 1
+        self.bitboard = bitboard.set_exponent(
+            self.bitboard, i, bitboard.to_exponent(value))
 
     def copy_state(self):
         '''
         Creates a copy of the state. Ideal for creating successors.
         '''
         child = GameState()
-        child.board = self.board[:]
-        child.nr_empty_tile = self.nr_empty_tile
+        child.bitboard = self.bitboard
         return child
 
     def get_empty_tiles(self):
         '''
         Return the index of all empty slots in the board.
         '''
-        empty_indices = []
-        for i in range(Game.dim*Game.dim):
-            if self.board[i] == 0:
-                empty_indices.append(i)
-        return empty_indices
+        return bitboard.empty_indices(self.bitboard)
 
     def create_representation(self):
         return self.board
@@ -88,75 +112,13 @@ class GameState(object):
         Method will move board into a new state. A direction is provided 
         (Left, right, up, down), and will decide how tiles should be moved
         or combined. The method makes sure that the board transition into a state
-        that is valid.
-        '''
-        movement = False
-        for row in range(Game.dim):
-            combined = False
-            for col in self.calc_range(direction):
-                i = self.calc_index(direction, row, col)
-                for c in self.calc_range2(direction, col):
-                    j = self.calc_index(direction, row, c)
-                    if self.board[i] >0 and self.board[j]>0:
-                        if not combined and self.board[i] == self.board[j]:
-                            self.combine(i, j)
-                            combined = True
-                            movement = True
-                        break
-                    elif self.board[i]==0 and self.board[j]>0:
-                        movement = True
-                        self.move(i, j)
-        return movement
-        
-
-    def calc_range2(self, d, col):
-        '''
-        Creates a range for a for-loop. The range depends on the
-        direction of the move.
-        '''
-        if d is Direction.RIGHT or d is Direction.DOWN:
-            return range(col -1, -1, -1)
-        elif d is Direction.LEFT or d is Direction.UP:
-            return range(col+1, Game.dim)
-       
-        raise Exception("Not a valid Enum")
-
-    def calc_range(self, d):
-        '''
-        Creates a range for a for-loop. The range depends on the
-        direction of the move.
-        '''
-        if d is Direction.RIGHT or d is Direction.DOWN:
-            return range(Game.dim-1, -1, -1)
-        elif d is Direction.LEFT or d is Direction.UP:
-            return range(0, Game.dim)
-       
-        raise Exception("Not a valid enum")
-
-
-    def calc_index(self, d, row, col):
-        '''
-        Will calculate 1D index from row and column index. This 1D index
-        differ depending on move direction.
+        that is valid. Each row (or column, for up and down) is moved with a
+        single lookup in the precomputed row tables.
         '''
-        if d is Direction.LEFT or d is Direction.RIGHT:
-            return (Game.dim * row) + col
-        else:
-            return (Game.dim*col) + row
-
-
-    def combine(self, s, t):
-        '''
-        Method for combining two tiles on the board.
-        s - index of slot where the tile should be combined to a new larger tile
-        t - the tile that should be removed.
-        Note that combine will not check the validity of the tile combine.
-        IE if there are tiles inbetween or the tiles are dissimilar.
-        '''
-        new_value = self.board[t] + self.board[s]
-        self.board[s] = new_value
-        self.board[t] = 0
-        self.nr_empty_tile += 1
+        new_board = bitboard.execute_move(self.bitboard, direction.value)
+        movement = new_board != self.bitboard
+        self.bitboard = new_board
+        return movement
 
     def terminal_state(self):
         '''
@@ -170,29 +132,15 @@ class GameState(object):
         else:
             #No empty slots so merge has to be done somehow between
             #imediate neighbors
-            dim = Game.dim
-            for i in range(0, dim):
-                for j in range(1, dim):
-                    #print("i: " + str(i) +" : j:" + str(j))
-                    if self.get(j,i) == self.get(j-1, i) or self.get(i,j) == self.get(i, j-1):
-                        return False
-            return True
-
-    def move(self, to_index, from_index):
-        '''
-        A tile is moved from one index, to another index on the board.
-        The method does not check the validity of the move to be performed.
-        IE tiles inbetween.
-        '''
-        self.board[to_index] = self.board[from_index]
-        self.board[from_index] = 0
+            return not bitboard.has_merges(self.bitboard)
 
     def __repr__(self):
         representation = ""
+        board = self.board
         for i in range(0, Game.dim):
             representation +="|"
             for j in range(0, Game.dim):
-                value = self.board[(Game.dim*i)+j]
+                value = board[(Game.dim*i)+j]
                 representation += str(value) + "\t"
             representation +="|\n"
         return representation
@@ -205,11 +153,26 @@ class Direction(Enum):
 
 
 class GameNode(Node):
-    def __init__(self, state, parent=None, player=Player.MAX, tile=None):
+    __slots__ = ("state", "last_tile", "all_children", "move", "components")
+    #Row and column score tables, built once from Game.heuristic_weights.
+    table = HeuristicTable(Game.heuristic_weights)
+    heuristic = table
+    #If set, heuristic components updated from the parent are checked
+    #against a full recomputation.
+    verify_components = False
+
+    def __init__(self, state, parent=None, player=Player.MAX, tile=None, move=None,
+            components=None):
         super().__init__(parent=parent, player=player)
         self.state = state
         self.last_tile = tile
+        #The move leading to this node. A Direction for MAX children, and a
+        #(slot index, tile) pair for MIN children.
+        self.move = move
         self.all_children = True
+        #Heuristic components of the state, see HeuristicTable. Passed on
+        #from the parent when it is known, otherwise computed when needed.
+        self.components = components
 
     def __repr__(self):
         return self.state.__repr__()
@@ -219,21 +182,58 @@ class GameNode(Node):
         The method will return a score, created from the combined weighted sum
         of each heuristics component. available slots and monotonicity is weighted
         higher, because these are important for avoiding terminal states.
+        The score is looked up in the precomputed heuristic tables, and
+        matches the weighted sum of the component methods below.
+        '''
+        if GameNode.heuristic is not GameNode.table:
+            return GameNode.heuristic.evaluate(self.state.bitboard)
+        return GameNode.table.score(self.state.bitboard, self.heuristic_components())
+
+    def heuristic_components(self):
+        '''
+        Returns the heuristic components of the state, computing them from
+        scratch if they were not passed on from the parent.
         '''
+        if self.components is None:
+            self.components = GameNode.table.components(self.state.bitboard)
+        elif GameNode.verify_components:
+            expected = GameNode.table.components(self.state.bitboard)
+            if expected != self.components:
+                raise Exception("Heuristic components " + str(self.components)
+                    + " differ from " + str(expected) + " for\n" + repr(self))
+        return self.components
+
+    @staticmethod
+    def use_symmetric_heuristic(symmetric=True):
+        '''
+        Switches all nodes to an evaluation that gives symmetric boards
+        the same score. Needed when caching on canonical boards.
+        '''
+        if symmetric:
+            GameNode.heuristic = SymmetricHeuristic(GameNode.table)
+        else:
+            GameNode.heuristic = GameNode.table
+
+    def get_component_heuristic_value(self):
+        '''
+        Computes the score directly from the component methods. Slow, but
+        useful for checking the heuristic tables.
+        '''
+        weights = Game.heuristic_weights
         corner = self.largest_in_corner()
         available = self.available_tiles()
         monotonicity = self.monotonicity()
         merges = self.merge_possibilities()
-        score = (4500*(available)) + (500*corner) + (4000*monotonicity) + (1000*merges)
-        #print("------------------------------------")
-        #print(self.state)
-        #print("AVAILABLE: " + str(available))
-        #print("CORNER: " + str(corner))
-        #print("SMOOTHNESS: " + str(smoothness))
-        #print("MONOTONICITY: " + str(monotonicity))
-        #print("TOTAL-SCORE: " + str(score))
-        #print("------------------------------------")
-        return score
+        return ((weights["available"]*available)
+            + (weights["corner"]*corner)
+            + (weights["monotonicity"]*monotonicity)
+            + (weights["merges"]*merges))
+
+    def heuristic_bounds(self):
+        '''
+        Lower and upper bound of get_heuristic_value over all boards.
+        '''
+        return GameNode.heuristic.bounds()
 
     def available_tiles(self):
         '''
@@ -302,21 +302,29 @@ class GameNode(Node):
     def is_state_terminal(self):
         return self.state.terminal_state()
 
+    def state_key(self):
+        return self.state.bitboard
+
+    def allocation_count(self):
+        return Node.allocations[0] + GameState.allocations[0]
+
     def probability(self, n):
         '''
         For imp. of expectimax
         '''
-        return float((1/n)*Game.probability[self.last_tile])
+        return GameNode.tile_probability(self.last_tile, n)
 
-    def generate_successors(self, p):
+    @staticmethod
+    def tile_probability(tile, n):
+        return float((1/n)*Game.probability[tile])
+
+    def successor_boards(self, p):
         '''
-        Will generate successors for the current GameState. The children will
-        be different depending if it's the max or min players turn. For example
-        will MAX's children include a child node for each possible direction
-        that actually alter the GameState. If it's the MIN's a child for each 
-        empty slot is returned.
+        The boards of the successors, without creating nodes. Yields
+        (board, tile, move) for each child generate_successors would create,
+        in the same order, where tile is None for MAX children.
         '''
-        succ = []
+        b = self.state.bitboard
         if p is Player.MIN:
             empty_slots = self.state.get_empty_tiles()
             #Make 2C cases. Need to consider C approches
@@ -324,42 +332,59 @@ class GameNode(Node):
             #2C branching might be excessive
             for i in empty_slots:
                 if Game.all_min_children or len(empty_slots) <=4:
-                    new_state = self.state.copy_state()
-                    new_state.set(i, 2)
-                    succ.append(GameNode(
-                        new_state,
-                        parent=self,
-                        player=Player.MIN,
-                        tile=2
-                    ))
-                    new_state = self.state.copy_state()
-                    new_state.set(i, 2)
-                    succ.append(GameNode(new_state,
-                        parent=self,
-                        player=Player.MIN,
-                        tile=4
-                    ))
+                    #Known bug, kept from the original code so search
+                    #results do not change: the child for a 4 tile also
+                    #gets a 2 tile (exponent 1). Only its probability is
+                    #that of a 4.
+                    board = bitboard.set_exponent(b, i, 1)
+                    yield board, 2, (i, 2)
+                    yield board, 4, (i, 4)
                 else:
-                    new_state = self.state.copy_state()
                     tile_value = self.state.pick_random()
-                    new_state.board[i] = tile_value
-                    succ.append(GameNode(new_state,
-                        parent=self,
-                        player=Player.MIN,
-                        tile=tile_value
-                    ))
+                    yield (bitboard.set_exponent(b, i, bitboard.to_exponent(tile_value)),
+                        tile_value, (i, tile_value))
         elif p is Player.MAX:
-            for i in range(1, Game.dim+1):
-                new_state = self.state.copy_state()
-                movement = new_state.perform_action(Direction(i))
-                if movement:
-                    succ.append(GameNode(
-                        new_state,
-                        parent=self,
-                        player=Player.MAX
-                        ))
-        #random.shuffle(succ)
-        return succ
+            for direction in Direction:
+                board = bitboard.execute_move(b, direction.value)
+                if board != b:
+                    yield board, None, direction
+
+    def generate_successors(self, p):
+        '''
+        Will generate successors for the current GameState. The children will
+        be different depending if it's the max or min players turn. For example
+        will MAX's children include a child node for each possible direction
+        that actually alter the GameState. If it's the MIN's a child for each 
+        empty slot is returned. Children are yielded one at a time, so a
+        search that cuts off never creates the rest.
+        The heuristic components of each child are updated from those of
+        this node, for the row and column of a new tile or the lines
+        changed by a move, unless a different heuristic is in use.
+        '''
+        table = GameNode.table
+        incremental = GameNode.heuristic is table
+        if incremental:
+            components = self.heuristic_components()
+            rows, cols = table.lines(self.state.bitboard)
+        child_components = None
+        for board, tile, move in self.successor_boards(p):
+            if incremental:
+                if p is Player.MIN:
+                    i = move[0]
+                    child_components = table.spawn(components, rows, cols, i,
+                        bitboard.get_exponent(board, i))
+                else:
+                    child_components = table.slide(components, rows, cols, board)
+            new_state = GameState()
+            new_state.bitboard = board
+            yield GameNode(
+                new_state,
+                parent=self,
+                player=p,
+                tile=tile,
+                move=move,
+                components=child_components
+                )
 
 board = [
     64, 32, 16, 8,
@@ -372,14 +397,15 @@ board2 = [
     0,0,0,0,
     2,2,2,0,
     2,4,2,2,
-    4,2,1028,1028,
+    4,2,1024,1024,
     ]
 
-state = GameState()
-state.board = board2
-node =GameNode(state)
-#print(state.terminal_state())
-print(node.monotonicity())
-print(node.largest_in_corner())
-print(node.available_tiles())
-print(node.merge_possibilities())
\ No newline at end of file
+if __name__ == "__main__":
+    state = GameState()
+    state.board = board2
+    node =GameNode(state)
+    #print(state.terminal_state())
+    print(node.monotonicity())
+    print(node.largest_in_corner())
+    print(node.available_tiles())
+    print(node.merge_possibilities())
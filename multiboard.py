@@ -0,0 +1,201 @@
+'''
+Best moves for many boards at once, for serving many games in parallel.
+Searching one board per call pays the solver setup, the Python call
+overhead and the heuristic per board. MultiBoardSolver instead searches
+a whole list of boards together:
+
+    - identical boards are searched once
+    - boards are searched in chunks, with one frontier and one batched
+      leaf evaluation per chunk (see batch.BatchExpectimax)
+    - one transposition table is shared by all boards and kept between
+      calls, so positions reached from several games are searched once
+    - with workers, the chunks are spread over one process pool, started
+      once and kept until close() is called. The table is not shared
+      between processes: each worker keeps its own, so a position is
+      searched once per worker rather than once per batch.
+
+    solver = MultiBoardSolver(workers=4)
+    moves = solver.best_moves(boards, depth=3)
+    solver.close()
+'''
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import multiprocessing
+import numbers
+import time
+
+from model import GameState, GameNode, Game
+from search import IterativeDeepening
+from cache import TranspositionTable
+from stats import SearchStats
+from batch import BatchExpectimax
+from cancel import WorkerToken, cancel_generation
+import bitboard
+
+#Solver of the worker process, created once by the pool initializer, and
+#the counter the parent moves on to cancel running tasks.
+_worker_solver = None
+_generation = None
+
+
+def _init_worker(cache_entries, generation):
+    global _worker_solver, _generation
+    _worker_solver = _make_solver(cache_entries)
+    _generation = generation
+
+
+def _make_solver(cache_entries):
+    cache = None
+    if cache_entries:
+        cache = TranspositionTable(max_entries=cache_entries)
+    return BatchExpectimax(cache=cache)
+
+
+def _search_boards(boards, depth, all_min_children, generation):
+    '''
+    Runs in a worker. Game.all_min_children is a class variable, so it is
+    passed along and set for every task. The task stops early once the
+    parent cancels the generation it was submitted in.
+    '''
+    Game.all_min_children = all_min_children
+    token = WorkerToken(_generation, generation)
+    return search_boards(_worker_solver, boards, depth, token), _worker_solver.stats
+
+
+def search_boards(solver, boards, depth, token=None):
+    '''
+    Searches the packed boards with one call to solver.search_many, and
+    returns a (move, value) pair for each board, (None, None) if it has no
+    moves or the search was cancelled. The move is a Direction.
+    '''
+    roots = []
+    for b in boards:
+        state = GameState()
+        state.bitboard = b
+        roots.append(GameNode(state))
+    results = []
+    for evaluations in solver.search_many(roots, depth, token):
+        if evaluations:
+            value, child = max(evaluations, key = lambda t: t[0])
+            results.append((child.move, value))
+        else:
+            results.append((None, None))
+    return results
+
+
+class MultiBoardSolver(object):
+    '''
+    Boards are given as lists of 16 tile values, like GameState.board, or
+    as packed boards, also the NumPy integers of batch.pack_boards.
+    workers=1 searches in this process. chunk_size is the number of boards
+    searched with one frontier, which bounds the memory used by a single
+    search.
+    '''
+    #Seconds between checks of a CancelToken while waiting for a chunk.
+    poll_interval = 0.01
+
+    def __init__(self, workers=1, cache_entries=200000, chunk_size=32, sink=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.sink = sink
+        self.stats = SearchStats(0)
+        self.pool = None
+        self.solver = None
+        self.cancelled = False
+        if workers > 1:
+            self.generation = multiprocessing.Value("i", 0)
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(cache_entries, self.generation))
+        else:
+            self.solver = _make_solver(cache_entries)
+
+    def best_moves(self, boards, depth=3, time_limit=None):
+        '''
+        Returns a (move, value) pair for each board, in the order of boards.
+        With time_limit (in milliseconds), all boards are searched together
+        with iterative deepening, and depth caps the deepest iteration.
+        '''
+        if time_limit is None:
+            results = self.search(boards, depth)
+        else:
+            results = IterativeDeepening(self, time_limit).search(boards, depth)
+        if results is None:
+            return [(None, None)]*len(boards)
+        return results
+
+    def search(self, boards, depth=3, token=None):
+        '''
+        One search of all boards at the given depth. Returns None if none of
+        the boards has a move, so IterativeDeepening can use it as a solver.
+        If token cancels the search, the chunks that completed keep their
+        answers, and the other boards get (None, None). Chunks running in
+        the workers are cancelled too.
+        '''
+        start = time.perf_counter()
+        self.stats = SearchStats(depth)
+        self.cancelled = False
+        packed = [int(b) if isinstance(b, numbers.Integral) else bitboard.from_list(b)
+            for b in boards]
+        unique = list(dict.fromkeys(packed))
+        chunks = [unique[i:i + self.chunk_size]
+            for i in range(0, len(unique), self.chunk_size)]
+        results = []
+        if self.pool is not None:
+            futures = [self.pool.submit(_search_boards, chunk, depth, Game.all_min_children,
+                self.generation.value) for chunk in chunks]
+            for future in futures:
+                chunk_results, stats = self.result(future, token)
+                if chunk_results is None:
+                    #Chunks running in the workers stop at their next check.
+                    cancel_generation(self.generation)
+                    break
+                results.extend(chunk_results)
+                self.stats.merge(stats)
+            for future in futures:
+                future.cancel()
+        else:
+            for chunk in chunks:
+                results.extend(search_boards(self.solver, chunk, depth, token))
+                self.stats.merge(self.solver.stats)
+                if self.solver.cancelled:
+                    self.cancelled = True
+                    break
+        results.extend([(None, None)]*(len(unique) - len(results)))
+        self.stats.cancelled = self.cancelled
+        self.stats.elapsed = time.perf_counter() - start
+        if self.sink is not None:
+            self.sink.emit(self.stats)
+        answers = dict(zip(unique, results))
+        if all(move is None for move, _ in results):
+            return None
+        return [answers[b] for b in packed]
+
+    def result(self, future, token):
+        '''
+        Waits for a chunk, checking token meanwhile. Returns (None, None) if
+        the search is cancelled first.
+        '''
+        while True:
+            try:
+                return future.result(timeout=self.poll_interval)
+            except TimeoutError:
+                if token is not None and token.is_cancelled():
+                    self.cancelled = True
+                    return None, None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def best_moves(boards, depth=3, time_limit=None, workers=1):
+    '''
+    Convenience function for a single batch of boards. Starts and stops its
+    own MultiBoardSolver, so keep a solver around to serve repeated calls.
+    '''
+    solver = MultiBoardSolver(workers=workers)
+    try:
+        return solver.best_moves(boards, depth, time_limit)
+    finally:
+        solver.close()
@@ -0,0 +1,61 @@
+class MoveOrdering(object):
+    '''
+    Orders the children of AlphaBetaSearch nodes so cutoffs come early.
+    Three sources are combined, each can be switched off:
+
+    killers - moves that caused a cutoff at the same level of the tree
+              are tried first. Up to two are kept per level.
+    history - every cutoff adds remaining_depth^2 to the score of its move.
+              Mostly useful for MIN, where moves are tile placements.
+    presort - children are sorted by their heuristic value, best first
+              for MAX and worst first for MIN.
+
+    The tables are kept between searches, so they carry over from one
+    iterative deepening pass to the next. History is halved at the start
+    of every search so old moves fade out.
+    '''
+    def __init__(self, presort=True, killers=True, history=True):
+        self.presort = presort
+        self.use_killers = killers
+        self.use_history = history
+        self.killers = {}
+        self.history = {}
+
+    def new_search(self):
+        for move in self.history:
+            self.history[move] //= 2
+
+    def order_max(self, node, children):
+        return self.order(node, children, True)
+
+    def order_min(self, node, children):
+        return self.order(node, children, False)
+
+    def order(self, node, children, maximize):
+        children = list(children)
+        if len(children) < 2:
+            return children
+        killers = self.killers.get(node.level, ()) if self.use_killers else ()
+        history = self.history if self.use_history else {}
+        sign = -1 if maximize else 1
+
+        def key(child):
+            move = child.move
+            killer = killers.index(move) if move in killers else len(killers)
+            heuristic = sign*child.get_heuristic_value() if self.presort else 0
+            return (killer, -history.get(move, 0), heuristic)
+        return sorted(children, key=key)
+
+    def cutoff(self, node, child):
+        '''
+        Records that child caused a cutoff below node.
+        '''
+        move = child.move
+        if self.use_killers:
+            killers = self.killers.setdefault(node.level, [])
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[2:]
+        if self.use_history:
+            remaining = max(node.remaining_depth(), 0)
+            self.history[move] = self.history.get(move, 0) + remaining*remaining
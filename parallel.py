@@ -0,0 +1,141 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import multiprocessing
+from abstractnode import Node, Player
+from model import GameState, GameNode, Game
+from search import Expectimax
+from cancel import SearchCancelled, WorkerToken, cancel_generation
+from cache import TranspositionTable
+
+#Solver of the worker process, created once by the pool initializer, and
+#the counter the parent moves on to cancel running tasks.
+_worker_solver = None
+_generation = None
+
+
+def _init_worker(cache_entries, prob_cutoff, generation):
+    global _worker_solver, _generation
+    _generation = generation
+    cache = None
+    if cache_entries:
+        cache = TranspositionTable(max_entries=cache_entries)
+    _worker_solver = Expectimax(cache=cache, prob_cutoff=prob_cutoff)
+
+
+def _evaluate(board, max_depth, level, player, all_min_children, prob, generation):
+    '''
+    Runs in a worker. Rebuilds the node from its packed board and returns
+    its expectimax value and the SearchStats of the task. The search
+    settings are class variables, so they are passed along and set for
+    every task. Raises SearchCancelled once the parent cancels the
+    generation the task was submitted in.
+    '''
+    Node.max_depth = max_depth
+    Game.all_min_children = all_min_children
+    state = GameState()
+    state.bitboard = board
+    node = GameNode(state, player=player)
+    node.level = level
+    node.root = False
+    _worker_solver.begin(max_depth, node, WorkerToken(_generation, generation))
+    value = _worker_solver.value(node, player, prob)
+    _worker_solver.finish(node)
+    return value, _worker_solver.stats
+
+class ParallelExpectimax(Expectimax):
+    '''
+    Expectimax where the moves at the root are searched in a pool of worker
+    processes, since threads are held back by the GIL. With split_chance,
+    each tile placement after a root move becomes its own task, which
+    gives up to 2*empty tasks per move and balances better over many
+    cores. The pool is started once and kept until close() is called.
+
+    The best move is the same as the one the serial search finds when
+    Game.all_min_children is set. Otherwise MIN nodes sample tile values,
+    and the workers draw different samples than the serial search would.
+    A cancelled search stops waiting for the workers, the tasks that have
+    not started are dropped, and the running ones stop at their next check
+    of the token.
+    '''
+    #Seconds between checks of the CancelToken while waiting for a task.
+    poll_interval = 0.01
+
+    def __init__(self, workers=None, split_chance=False, cache_entries=None,
+            sink=None, verbose=False, prob_cutoff=0.0):
+        super().__init__(sink=sink, verbose=verbose, prob_cutoff=prob_cutoff)
+        self.split_chance = split_chance
+        self.generation = multiprocessing.Value("i", 0)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cache_entries, prob_cutoff, self.generation))
+
+    def max_value(self, s, prob=1.0):
+        if not s.root:
+            return super().max_value(s, prob)
+        children = list(s.get_max_children())
+        if self.split_chance:
+            jobs = self.split_jobs(children)
+        else:
+            jobs = [(c, [self.submit(c, Player.MAX)], None) for c in children]
+        try:
+            for child, futures, weights in jobs:
+                self.evaluations.append((self.job_value(child, futures, weights), child))
+        except SearchCancelled:
+            cancel_generation(self.generation)
+            raise
+        finally:
+            #Tasks left after a cancelled search are not needed any more.
+            for _, futures, _ in jobs:
+                for future in futures or ():
+                    future.cancel()
+        values = [value for value, _ in self.evaluations]
+        return max(values) if values else -float("inf")
+
+    def split_jobs(self, children):
+        '''
+        Submits the chance layer below each root move to the pool. Returns
+        a (child, futures, weights) job per root move, with the futures of
+        the tile placements and their weights in the expectation.
+        '''
+        jobs = []
+        for child in children:
+            if child.terminal_state():
+                jobs.append((child, None, None))
+                continue
+            grandchildren = list(child.get_min_children())
+            weights = [g.probability(len(grandchildren)) for g in grandchildren]
+            futures = [self.submit(g, Player.MIN, w) for g, w in zip(grandchildren, weights)]
+            jobs.append((child, futures, weights))
+        return jobs
+
+    def job_value(self, child, futures, weights):
+        if futures is None:
+            return child.get_heuristic_value()
+        if weights is None:
+            return self.result(futures[0])
+        return self.expectation([self.result(f) for f in futures], weights)
+
+    def submit(self, node, player, prob=1.0):
+        return self.pool.submit(_evaluate, node.state.bitboard, Node.max_depth,
+            node.level, player, Game.all_min_children, prob, self.generation.value)
+
+    def result(self, future):
+        '''
+        Waits for a task. With a CancelToken, the token is checked every
+        poll_interval seconds while waiting.
+        '''
+        if self.token is None:
+            value, stats = future.result()
+        else:
+            while True:
+                try:
+                    value, stats = future.result(timeout=self.poll_interval)
+                    break
+                except TimeoutError:
+                    if self.token.is_cancelled():
+                        raise SearchCancelled()
+        self.stats.merge(stats)
+        return value
+
+    def close(self):
+        self.pool.shutdown()
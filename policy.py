@@ -0,0 +1,85 @@
+from model import Game
+import bitboard
+
+class DepthPolicy(object):
+    '''
+    Chooses how deep to search a board. The cost of a search is dominated by
+    the MIN layers, which get one or two children per empty slot, so open
+    boards get a shallow search and crowded boards a deeper one. The depth
+    is the largest one whose estimated node count fits in node_budget.
+    Boards with many distinct tiles have few merges left and are the ones
+    most likely to be lost, so they are given at least one extra ply.
+    '''
+    def __init__(self, node_budget=50000, min_depth=2, max_depth=8, crowded_distinct=9):
+        self.node_budget = node_budget
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.crowded_distinct = crowded_distinct
+        self.last_choice = None
+
+    def choose(self, state):
+        '''
+        Returns a dict describing the choice. The depth to search is found
+        under "depth", the rest explains why it was picked. "reason" names
+        the one thing that set the depth: "crowded" if it is the minimum,
+        raised for a crowded board, otherwise "max_depth" if it is capped
+        there, otherwise "budget". "crowded" tells if the minimum was
+        raised, also when something else set the depth.
+        '''
+        b = state.bitboard
+        empty = bitboard.count_empty(b)
+        distinct = len(set(e for e in (bitboard.get_exponent(b, i) for i in range(16)) if e))
+        moves = sum(1 for d in range(1, 5) if bitboard.execute_move(b, d) != b)
+        min_depth = self.min_depth
+        crowded = distinct >= self.crowded_distinct
+        if crowded:
+            min_depth = min(self.max_depth, min_depth + 1)
+        depth = min_depth
+        estimate = self.estimate_nodes(moves, empty, depth)
+        while depth < self.max_depth:
+            next_estimate = self.estimate_nodes(moves, empty, depth + 1)
+            if next_estimate > self.node_budget:
+                break
+            depth += 1
+            estimate = next_estimate
+        if crowded and depth == min_depth:
+            reason = "crowded"
+        elif depth == self.max_depth:
+            reason = "max_depth"
+        else:
+            reason = "budget"
+        self.last_choice = {
+            "depth": depth,
+            "empty": empty,
+            "distinct": distinct,
+            "moves": moves,
+            "estimated_nodes": estimate,
+            "reason": reason,
+            "crowded": crowded,
+        }
+        return self.last_choice
+
+    def spawn_branching(self, empty):
+        '''
+        Children of a MIN node, following GameNode.generate_successors.
+        A move frees at least one slot, so there is always one to fill.
+        '''
+        empty = max(empty, 1)
+        if Game.all_min_children or empty <= 4:
+            return 2*empty
+        return empty
+
+    def estimate_nodes(self, moves, empty, depth):
+        '''
+        Estimated node count of a search to depth, where leaves are found
+        at level depth + 1. MAX and MIN levels alternate from the root.
+        '''
+        total = 0
+        width = 1
+        for level in range(1, depth + 2):
+            if level % 2:
+                width *= max(moves, 1)
+            else:
+                width *= self.spawn_branching(empty)
+            total += width
+        return total
@@ -1,14 +1,115 @@
 from abstractnode import Node
 from abstractnode import Player
-class AlphaBetaSearch(object):
+from cache import Bound
+from cancel import CancelToken, SearchCancelled
+from stats import SearchStats
+import math
+import time
+
+class Solver(object):
+    '''
+    Common bookkeeping for the solvers. Every search leaves a SearchStats in
+    self.stats, and passes it to the sink if one is given (for example a
+    RingBufferSink or JsonlSink). Searches are silent unless verbose is
+    set, in which case the root alternatives are printed after each search.
+
+    A search given a CancelToken checks it every check_interval nodes, and
+    stops when it is cancelled or its deadline passes. The search then
+    returns the best of the root moves it completed, and sets cancelled.
+    '''
+    check_interval = 256
+
+    def __init__(self, cache=None, sink=None, verbose=False):
+        self.evaluations = []
+        self.cache = cache
+        self.sink = sink
+        self.verbose = verbose
+        self.stats = SearchStats(0)
+        self.start = 0.0
+        self.hits = 0
+        self.allocated = 0
+        self.token = None
+        #Nodes left until the token is checked. Never reaches 0 without one.
+        self.countdown = -1
+        self.cancelled = False
+
+    def begin(self, depth, root, token=None):
+        Node.max_depth = depth
+        self.evaluations = []
+        self.stats = SearchStats(depth)
+        self.start = time.perf_counter()
+        self.hits = self.cache.hits if self.cache is not None else 0
+        self.allocated = root.allocation_count()
+        self.token = token
+        self.countdown = Solver.check_interval if token is not None else -1
+        self.cancelled = False
+
+    def checkpoint(self):
+        self.countdown = Solver.check_interval
+        if self.token.is_cancelled():
+            raise SearchCancelled()
+
+    def interruptible(self, search, *args):
+        '''
+        Calls search(*args), and returns normally if it is cancelled. The
+        root moves completed before that are kept in self.evaluations.
+        '''
+        try:
+            search(*args)
+        except SearchCancelled:
+            self.cancelled = True
+
+    def finish(self, root):
+        '''
+        Completes the stats of the search, and returns the child of root
+        with the best evaluation, or None if root has no children.
+        '''
+        stats = self.stats
+        stats.elapsed = time.perf_counter() - self.start
+        stats.cancelled = self.cancelled
+        stats.allocations = root.allocation_count() - self.allocated
+        if self.cache is not None:
+            stats.cache_hits = self.cache.hits - self.hits
+        if self.sink is not None:
+            self.sink.emit(stats)
+        if len(self.evaluations) > 0:
+            best = max(self.evaluations, key = lambda t: t[0])
+            if self.verbose:
+                self.print_evaluations(root, best)
+            return best[1]
+        return None
+
+    def print_evaluations(self, root, best):
+        print("\n----------PREVIOUS------------")
+        print(root)
+        print("----------BEST NEXT------------")
+        print(best[1])
+        print(best[1].get_heuristic_value())
+        print("\n----------ALTERNATIVES------------")
+        for tile in self.evaluations:
+            print(tile[1])
+            print("HEURISTIC: " + str(tile[1].get_heuristic_value()))
+            print("EVAL: " + str(tile[0]))
+            print("-----------------")
+        print("------------------------------")
+        print(self.stats)
+        print("\n\n")
+
+
+class AlphaBetaSearch(Solver):
     '''
     Based on the pseudo code found in the AI textbook, Artifical intelligence, 
-    a modern approch
+    a modern approch. An optional TranspositionTable lets the search reuse
+    values of positions reached through different move orders. Since values
+    found under pruning are often only bounds, the bound type is stored too.
     '''
-    def __init__(self):
-        self.evaluations =[]
+    def __init__(self, cache=None, sink=None, verbose=False, ordering=None):
+        super().__init__(cache=cache, sink=sink, verbose=verbose)
+        #Optional MoveOrdering. Children are searched in generation order
+        #without it.
+        self.ordering = ordering
 
-    def search(self, root, depth=3):
+    def search(self, root, depth=3, token=None):
         '''
         Method will run a minmax search using the provided root object.
         The root object should be a object that support the methods found in
@@ -16,106 +117,417 @@ class AlphaBetaSearch(object):
         before generating a heuristics value for the state. The child
         of root that has the best evaluation is returned by search.
         '''
-        Node.max_depth = depth
-        self.evaluations = []
-        value = self.max_value(root, -float("inf"), float("inf"))
-        #Return child specified by the value!
-        #Print(value)min(data, key = lambda t: t[1])
-        if len(self.evaluations) > 0:
-            best = max(self.evaluations, key = lambda t: t[0])
-            print("\n----------PREVIOUS------------")
-            print(root)
-            print("----------BEST NEXT------------")
-            print(best[1])
-            print(best[1].get_heuristic_value())
-            print("\n----------ALTERNATIVES------------")
-            for tile in self.evaluations:
-                print(tile[1])
-                print("HEURISTIC: " + str(tile[1].get_heuristic_value()))
-                print("EVAL: " + str(tile[0]))
-                print("-----------------")
-            print("------------------------------")
-            print("\n\n")
-            return best[1]
-        return None
+        self.begin(depth, root, token)
+        if self.ordering is not None:
+            self.ordering.new_search()
+        self.interruptible(self.max_value, root, -float("inf"), float("inf"))
+        return self.finish(root)
 
     def max_value(self, node, alpha, beta):
+        stats = self.stats
+        stats.expanded[node.level] += 1
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.checkpoint()
         if node.terminal_state():
+            stats.leaves += 1
             return node.get_heuristic_value()
+        key = None
+        if self.cache is not None and not node.root:
+            key = self.cache.make_key(node.state_key(), node.remaining_depth(), True)
+            entry = self.cache.get(key)
+            if entry is not None:
+                alpha, beta, cached = self.probe(entry, alpha, beta)
+                if cached is not None:
+                    return cached
 
         value = -float("inf")
-        for child in node.get_max_children():
+        lower = alpha
+        children = node.get_max_children()
+        if self.ordering is not None:
+            children = self.ordering.order_max(node, children)
+        for child in children:
             #print("MAX level " + str(child.level))
             value = max(value, self.min_value(child, alpha, beta))
             if node.root:
                 self.evaluations.append((value, child))      
             if value >= beta:
-                return value
+                stats.cutoffs += 1
+                if self.ordering is not None:
+                    self.ordering.cutoff(node, child)
+                break
             alpha = max(alpha, value)
+        if key is not None:
+            self.store(key, value, lower, beta)
         return value
 
     def min_value(self, node, alpha, beta):
+        stats = self.stats
+        stats.expanded[node.level] += 1
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.checkpoint()
         if node.terminal_state():
+            stats.leaves += 1
             return node.get_heuristic_value()
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(node.state_key(), node.remaining_depth(), False)
+            entry = self.cache.get(key)
+            if entry is not None:
+                alpha, beta, cached = self.probe(entry, alpha, beta)
+                if cached is not None:
+                    return cached
+
         value = float("inf")
-        for child in node.get_min_children():
+        upper = beta
+        children = node.get_min_children()
+        if self.ordering is not None:
+            children = self.ordering.order_min(node, children)
+        for child in children:
             #print("MIN level " + str(child.level))
             value = min(value, self.max_value(child, alpha, beta))
             if value <= alpha:
-                return value
+                stats.cutoffs += 1
+                if self.ordering is not None:
+                    self.ordering.cutoff(node, child)
+                break
             beta = min(beta, value)
+        if key is not None:
+            self.store(key, value, alpha, upper)
         return value
 
+    def probe(self, entry, alpha, beta):
+        '''
+        Narrows the (alpha, beta) window with a cached entry. Returns the
+        new window, and the cached value if it settles the node.
+        '''
+        value, bound = entry
+        if bound is Bound.EXACT:
+            return alpha, beta, value
+        if bound is Bound.LOWER:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return alpha, beta, value
+        return alpha, beta, None
 
-class Expectimax(object):
+    def store(self, key, value, alpha, beta):
+        '''
+        Stores a value searched with the window (alpha, beta). A value outside
+        the window is only a bound on the true value.
+        '''
+        if value <= alpha:
+            bound = Bound.UPPER
+        elif value >= beta:
+            bound = Bound.LOWER
+        else:
+            bound = Bound.EXACT
+        self.cache.put(key, value, bound)
 
-    def __init__(self):
-        self.evaluations = []
 
-    def search(self, root, depth=3):
-        Node.max_depth = depth
-        best_value = self.max_value(root)
-        if len(self.evaluations) > 0:
-            best = max(self.evaluations, key = lambda t: t[0])
-            print("\n----------PREVIOUS------------")
-            print(root)
-            print("----------BEST NEXT------------")
-            print(best[1])
-            print(best[1].get_heuristic_value())
-            print("\n----------ALTERNATIVES------------")
-            for tile in self.evaluations:
-                print(tile[1])
-                print("HEURISTIC: " + str(tile[1].get_heuristic_value()))
-                print("EVAL: " + str(tile[0]))
-                print("-----------------")
-            print("------------------------------")
-            print("\n\n")
-            return best[1]
-        return None
+class Expectimax(Solver):
+    '''
+    Expectimax search, where MIN is a chance player placing random tiles.
+    Values are exact, so an optional TranspositionTable can return them
+    directly.
+
+    With prob_cutoff set, a node whose path probability (the product of
+    GameNode.probability along the path from the root) falls below it is
+    scored by the heuristic instead of being expanded. Unlikely lines, such
+    as several 4 tiles in a row, are then cut short, and the pruned nodes
+    are counted in stats.pruned. Cached values are approximate in this
+    mode, since they depend on the path that first reached the position.
+    '''
+    def __init__(self, cache=None, sink=None, verbose=False, prob_cutoff=0.0):
+        super().__init__(cache=cache, sink=sink, verbose=verbose)
+        self.prob_cutoff = prob_cutoff
 
-    def value(self, s, p):
+    def search(self, root, depth=3, token=None):
+        self.begin(depth, root, token)
+        self.stats.expanded[root.level] += 1
+        if root.is_state_terminal():
+            return self.finish(root)
+        self.interruptible(self.max_value, root, 1.0)
+        return self.finish(root)
+
+    def value(self, s, p, prob=1.0):
+        stats = self.stats
+        stats.expanded[s.level] += 1
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.checkpoint()
         if s.terminal_state():
+            stats.leaves += 1
+            return s.get_heuristic_value()
+        key = None
+        if self.cache is not None:
+            #A node created by MIN is a position where MAX is to move.
+            key = self.cache.make_key(s.state_key(), s.remaining_depth(), p == Player.MIN)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry[0]
+        if prob < self.prob_cutoff:
+            stats.pruned += 1
+            stats.leaves += 1
             return s.get_heuristic_value()
         if p == Player.MIN:
-            return self.max_value(s)
+            value = self.max_value(s, prob)
         if p == Player.MAX:
-            return self.exp_value(s)
+            value = self.exp_value(s, prob)
+        if key is not None:
+            self.cache.put(key, value)
+        return value
 
-    def max_value(self, s):
-        children = s.get_max_children()
-        values = [self.value(c, Player.MAX) for c in children]
+    def max_value(self, s, prob=1.0):
         if s.root:
-            self.evaluations = list(zip(values, children))
-        return max(values)
+            for child in s.get_max_children():
+                self.evaluations.append((self.value(child, Player.MAX, prob), child))
+            return max(value for value, _ in self.evaluations)
+        return max(self.value(c, Player.MAX, prob) for c in s.get_max_children())
 
-    def exp_value(self,s):
-        children = s.get_min_children()
-        values = [self.value(c, Player.MIN) for c in children]
+    def exp_value(self, s, prob=1.0):
+        #The number of children is needed for the probabilities.
+        children = list(s.get_min_children())
         weights = [c.probability(len(children)) for c in children]
+        values = [self.value(c, Player.MIN, prob*w) for c, w in zip(children, weights)]
         return self.expectation(values, weights)
     
     def expectation(self,values, weights):
         expectation = 0.0
         for i in range(len(values)):
             expectation += values[i]*weights[i]
-        return expectation
\ No newline at end of file
+        return expectation
+
+
+class StarExpectimax(Expectimax):
+    '''
+    Expectimax with Ballard's Star1 and Star2 pruning. The heuristic is
+    bounded (GameNode.heuristic_bounds), so once some children of a chance
+    node are searched, the bounds limit what its expectation can still
+    become. MAX nodes pass an (alpha, beta) window down, and a chance node
+    stops as soon as its value is known to fall outside it (Star1). With
+    star2 set, every child of a chance node is first probed with a single
+    move, which gives a lower bound on it, and the node is cut if those
+    lower bounds already reach beta. Star2 is off by default: on the
+    benchmark boards the probes never reached beta, so they only cost time.
+
+    The chosen move and its value are the same as with Expectimax when the
+    game tree is deterministic (Game.all_min_children). Cutoffs are counted
+    in star1_cutoffs and star2_cutoffs, and in total in stats.cutoffs.
+    '''
+    def __init__(self, cache=None, sink=None, verbose=False, prob_cutoff=0.0, star2=False):
+        super().__init__(cache=cache, sink=sink, verbose=verbose, prob_cutoff=prob_cutoff)
+        self.star2 = star2
+        self.star1_cutoffs = 0
+        self.star2_cutoffs = 0
+
+    def search(self, root, depth=3, token=None):
+        self.begin(depth, root, token)
+        self.star1_cutoffs = 0
+        self.star2_cutoffs = 0
+        #Values are expectations with weights summing to at most 1, or
+        #heuristic values, so they stay within the heuristic bounds widened
+        #to include 0.
+        lower, upper = root.heuristic_bounds()
+        self.lower = min(lower, 0.0)
+        self.upper = max(upper, 0.0)
+        self.stats.expanded[root.level] += 1
+        if root.is_state_terminal():
+            return self.finish(root)
+        self.interruptible(self.max_node, root, -float("inf"), float("inf"), 1.0)
+        return self.finish(root)
+
+    def max_node(self, s, alpha, beta, prob):
+        '''
+        Value of a node where MAX is to move, searched with the window
+        (alpha, beta). Values outside the window are bounds.
+        '''
+        stats = self.stats
+        if not s.root:
+            stats.expanded[s.level] += 1
+            self.countdown -= 1
+            if self.countdown == 0:
+                self.checkpoint()
+            if s.terminal_state():
+                stats.leaves += 1
+                return s.get_heuristic_value()
+        key = None
+        if self.cache is not None and not s.root:
+            key = self.cache.make_key(s.state_key(), s.remaining_depth(), True)
+            entry = self.cache.get(key)
+            if entry is not None and entry[1] is Bound.EXACT:
+                return entry[0]
+        if prob < self.prob_cutoff and not s.root:
+            stats.pruned += 1
+            stats.leaves += 1
+            return s.get_heuristic_value()
+        best = -float("inf")
+        for child in s.get_max_children():
+            value = self.chance_node(child, max(alpha, best), beta, prob)
+            if s.root:
+                self.evaluations.append((value, child))
+            if value > best:
+                best = value
+            if best >= beta:
+                stats.cutoffs += 1
+                break
+        if key is not None and alpha < best < beta:
+            self.cache.put(key, best)
+        return best
+
+    def chance_node(self, s, alpha, beta, prob):
+        '''
+        Expected value of a node where a tile is placed, searched with the
+        window (alpha, beta).
+        '''
+        stats = self.stats
+        stats.expanded[s.level] += 1
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.checkpoint()
+        if s.terminal_state():
+            stats.leaves += 1
+            return s.get_heuristic_value()
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(s.state_key(), s.remaining_depth(), False)
+            entry = self.cache.get(key)
+            if entry is not None and entry[1] is Bound.EXACT:
+                return entry[0]
+        if prob < self.prob_cutoff:
+            stats.pruned += 1
+            stats.leaves += 1
+            return s.get_heuristic_value()
+        children = list(s.get_min_children())
+        weights = [c.probability(len(children)) for c in children]
+        lows = [self.lower]*len(children)
+        #Probing only pays off if it can reach beta. With an infinite beta,
+        #as below the root, it would search without any chance of a cutoff.
+        if self.star2 and beta < float("inf"):
+            cut = self.probe(children, weights, lows, beta, prob)
+            if cut is not None:
+                return cut
+        #rest_low/rest_high bound the weighted sum of the children not yet
+        #searched. total adds up the same products, in the same order, as
+        #Expectimax.expectation.
+        rest_low = sum(w*low for w, low in zip(weights, lows))
+        rest_high = sum(weights)*self.upper
+        total = 0.0
+        for child, w, low in zip(children, weights, lows):
+            rest_low -= w*low
+            rest_high -= w*self.upper
+            child_alpha = (alpha - total - rest_high)/w
+            child_beta = (beta - total - rest_low)/w
+            value = self.max_node(child, child_alpha, child_beta, prob*w)
+            total += value*w
+            if value <= child_alpha:
+                self.star1_cutoffs += 1
+                stats.cutoffs += 1
+                return total + rest_high
+            if value >= child_beta:
+                self.star1_cutoffs += 1
+                stats.cutoffs += 1
+                return total + rest_low
+        if key is not None and alpha < total < beta:
+            self.cache.put(key, total)
+        return total
+
+    def probe(self, children, weights, lows, beta, prob):
+        '''
+        Star2 probing. The value of a MAX node is at least the value of any
+        of its moves, so searching one move of every child gives lower
+        bounds, stored in lows. Returns a lower bound of at least beta if
+        the chance node can be cut, otherwise None.
+        '''
+        sure = sum(w*low for w, low in zip(weights, lows))
+        for i, child in enumerate(children):
+            if child.terminal_state():
+                continue
+            first = next(iter(child.get_max_children()), None)
+            if first is None:
+                continue
+            w = weights[i]
+            #Only a probe value above probe_alpha can lead to a cutoff.
+            probe_alpha = (beta - sure)/w + lows[i]
+            if not math.isfinite(probe_alpha) or probe_alpha >= self.upper:
+                continue
+            value = self.chance_node(first, probe_alpha, float("inf"), prob*w)
+            if value > probe_alpha:
+                sure += w*(value - lows[i])
+                lows[i] = value
+                if sure >= beta:
+                    self.star2_cutoffs += 1
+                    self.stats.cutoffs += 1
+                    return sure
+        return None
+
+
+class IterativeDeepening(object):
+    '''
+    Anytime search. Runs the solver at increasing depth until the time
+    limit (in milliseconds) is used up, and returns the best child found by
+    the deepest search that completed. A new depth is only started if it is
+    expected to finish in time, estimated from how much longer the previous
+    depth took than the one before it. The time limit is strict: the
+    running search is cancelled when it runs out.
+    '''
+    #Growth in search time per extra ply, assumed until two depths are timed.
+    default_growth = 6.0
+
+    def __init__(self, solver, time_limit, min_depth=1, max_depth=12):
+        self.solver = solver
+        self.time_limit = time_limit
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.completed_depth = 0
+        self.iterations = []
+        self.nodes = 0
+
+    def search(self, root, depth=None, token=None):
+        '''
+        depth caps the deepest iteration, if given. token can stop the search
+        early, its deadline is moved forward to the time limit. If not even
+        the minimum depth completes, the best of the root moves it did
+        complete is returned, so a move is returned whenever one was found.
+        '''
+        max_depth = self.max_depth if depth is None else depth
+        start = time.perf_counter()
+        deadline = start + self.time_limit/1000.0
+        token = token or CancelToken()
+        token.limit(deadline)
+        self.completed_depth = 0
+        self.iterations = []
+        self.nodes = 0
+        best = None
+        d = self.min_depth
+        while d <= max_depth:
+            iteration_start = time.perf_counter()
+            child = self.solver.search(root, d, token)
+            now = time.perf_counter()
+            self.nodes += self.solver.stats.node_count()
+            self.iterations.append((d, now - iteration_start))
+            if self.solver.cancelled:
+                if best is None:
+                    best = child
+                break
+            if child is None:
+                break
+            best = child
+            self.completed_depth = d
+            if now + self.estimate_next() > deadline:
+                break
+            d += 1
+        return best
+
+    def estimate_next(self):
+        '''
+        Estimated time of the next iteration, in seconds.
+        '''
+        last = self.iterations[-1][1]
+        if len(self.iterations) > 1 and self.iterations[-2][1] > 0:
+            growth = max(1.0, last/self.iterations[-2][1])
+        else:
+            growth = self.default_growth
+        return last*growth
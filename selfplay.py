@@ -0,0 +1,113 @@
+'''
+Headless batch self-play. Plays complete games without the Tk display and
+without the pause between moves, spread over a pool of processes, and
+writes one result per game to a CSV or JSONL file:
+
+    python selfplay.py --games 1000 --seed 1 --solver expectimax --depth 2 \
+        --workers 8 --output results.jsonl
+
+Every game gets its own seed, derived from --seed, and plays out the same
+whether it runs in a worker or in the main process.
+'''
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import json
+import time
+
+from controller import GameController
+from environment import GameEnvironment, split_seeds
+from search import AlphaBetaSearch, Expectimax, StarExpectimax
+from sink import NullSink
+from ordering import MoveOrdering
+import batch
+
+FIELDS = ["seed", "solver", "depth", "max_tile", "score", "moves", "wall_time", "nodes"]
+
+SOLVERS = {
+    "alphabeta": AlphaBetaSearch,
+    "alphabeta-ordered": lambda: AlphaBetaSearch(ordering=MoveOrdering()),
+    "expectimax": Expectimax,
+    "star": StarExpectimax,
+}
+#The batched solver needs numpy.
+if batch.np is not None:
+    SOLVERS["batch"] = batch.BatchExpectimax
+
+
+def play_game(seed, solver_name, depth, all_min_children=False):
+    '''
+    Plays one game to the end and returns a dict with the FIELDS.
+    '''
+    controller = GameController(snapshot_sink=NullSink(), environment=GameEnvironment(seed))
+    controller.set_solver(SOLVERS[solver_name](), all_min_children=all_min_children)
+    controller.plies = depth
+    start = time.perf_counter()
+    while controller.step():
+        pass
+    return {
+        "seed": seed,
+        "solver": solver_name,
+        "depth": depth,
+        "max_tile": max(controller.model.board),
+        "score": controller.score,
+        "moves": controller.moves,
+        "wall_time": time.perf_counter() - start,
+        "nodes": controller.nodes,
+    }
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def run(seeds, solver_name, depth, workers=None, all_min_children=False):
+    '''
+    Plays a game for every seed, and yields the results in seed order.
+    '''
+    jobs = [(seed, solver_name, depth, all_min_children) for seed in seeds]
+    if workers == 1:
+        for job in jobs:
+            yield _play(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_play, jobs):
+            yield result
+
+
+def write_results(results, path):
+    '''
+    Writes results as they arrive, as CSV if path ends with .csv and as
+    JSON lines otherwise.
+    '''
+    with open(path, "w", newline="") as f:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
+                f.flush()
+        else:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless 2048 self-play")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0,
+        help="master seed, the seed of each game is derived from it")
+    parser.add_argument("--solver", choices=sorted(SOLVERS), default="alphabeta")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--all-min-children", action="store_true")
+    parser.add_argument("--workers", type=int, default=None,
+        help="number of processes, defaults to the number of cores")
+    parser.add_argument("--output", default="selfplay.jsonl")
+    args = parser.parse_args()
+    seeds = split_seeds(args.seed, args.games)
+    results = run(seeds, args.solver, args.depth, args.workers, args.all_min_children)
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
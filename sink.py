@@ -0,0 +1,117 @@
+'''
+Sinks for the board snapshots a GameController sends after every move.
+The controller only calls emit, so it does not know if anybody watches:
+
+    - NullSink drops every snapshot, for headless runs at full speed
+    - QueueSink keeps them in a bounded queue for a consumer on another
+      thread, like the display. When the queue is full, policy decides
+      what happens:
+        "block"        emit waits until the consumer has taken one, so
+                       the solver runs at the speed of the consumer. A
+                       producer on the consumer's own thread (the Tk
+                       thread, for keyboard moves) is never made to wait,
+                       since nothing could wake it up: the oldest snapshot
+                       is dropped instead
+        "drop_oldest"  the oldest snapshot is dropped, and the solver
+                       never waits
+        "sample"       only every N-th snapshot is queued, and the
+                       oldest is dropped when the queue is full
+'''
+from abc import ABCMeta, abstractmethod
+from collections import deque
+import threading
+import time
+
+class SnapshotSink(metaclass=ABCMeta):
+    '''
+    Interface of the snapshot sinks. Snapshots are dicts, like
+    {"state": board}.
+    '''
+    @abstractmethod
+    def emit(self, snapshot):
+        pass
+
+    def close(self):
+        pass
+
+class NullSink(SnapshotSink):
+    '''
+    Drops every snapshot.
+    '''
+    def emit(self, snapshot):
+        pass
+
+class QueueSink(SnapshotSink):
+    '''
+    Bounded queue of snapshots, see the policies above. emit is called by
+    the producer, poll by the consumer, and they may run on different
+    threads. dropped counts the snapshots that were never polled.
+    consumer is the thread that last polled.
+    '''
+    policies = ("block", "drop_oldest", "sample")
+
+    def __init__(self, maxsize=256, policy="drop_oldest", every=1):
+        if policy not in QueueSink.policies:
+            raise ValueError("Unknown policy " + str(policy))
+        if maxsize < 1 or every < 1:
+            raise ValueError("maxsize and every must be at least 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.every = every
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.emitted = 0
+        self.dropped = 0
+        self.closed = False
+        self.consumer = None
+
+    def __len__(self):
+        return len(self.queue)
+
+    def emit(self, snapshot):
+        '''
+        Queues the snapshot, stamped with the time it arrived.
+        '''
+        with self.condition:
+            self.emitted += 1
+            if self.closed or (self.policy == "sample" and self.emitted % self.every):
+                self.dropped += 1
+                return
+            if self.policy == "block" and threading.get_ident() != self.consumer:
+                while len(self.queue) >= self.maxsize and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    self.dropped += 1
+                    return
+            elif len(self.queue) >= self.maxsize:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append((time.perf_counter(), snapshot))
+
+    def poll(self, max_age=None):
+        '''
+        Returns the oldest queued snapshot, or None if the queue is empty.
+        With max_age, snapshots queued more than max_age seconds ago are
+        skipped, except the newest one, so a consumer that fell behind
+        catches up.
+        '''
+        with self.condition:
+            self.consumer = threading.get_ident()
+            if not self.queue:
+                return None
+            if max_age is not None:
+                now = time.perf_counter()
+                while len(self.queue) > 1 and now - self.queue[0][0] > max_age:
+                    self.queue.popleft()
+                    self.dropped += 1
+            snapshot = self.queue.popleft()[1]
+            self.condition.notify()
+            return snapshot
+
+    def close(self):
+        '''
+        Releases a producer blocked in emit. Later snapshots are dropped.
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,111 @@
+from collections import deque
+import json
+
+class SearchStats(object):
+    '''
+    Counters collected during one search. The solvers keep the stats of the
+    latest search in their stats attribute. expanded[level] is the number
+    of nodes visited at that level below the root, the root being level 0.
+    '''
+    def __init__(self, depth):
+        self.depth = depth
+        self.expanded = [0]*(depth + 2)
+        self.leaves = 0
+        self.cutoffs = 0
+        self.cache_hits = 0
+        #Nodes scored by the heuristic instead of being expanded, because
+        #their path probability was too low.
+        self.pruned = 0
+        #Node and state objects created during the search.
+        self.allocations = 0
+        #Set if the search was stopped by its CancelToken.
+        self.cancelled = False
+        self.elapsed = 0.0
+
+    def node_count(self):
+        return sum(self.expanded)
+
+    def branching_factor(self):
+        '''
+        Average number of children searched per interior node.
+        '''
+        interior = self.node_count() - self.leaves
+        if interior <= 0:
+            return 0.0
+        return (self.node_count() - 1)/interior
+
+    def cutoff_rate(self):
+        '''
+        Share of interior nodes that were cut off before all their
+        children were searched.
+        '''
+        interior = self.node_count() - self.leaves
+        if interior <= 0:
+            return 0.0
+        return self.cutoffs/interior
+
+    def allocations_per_node(self):
+        nodes = self.node_count()
+        if nodes == 0:
+            return 0.0
+        return self.allocations/nodes
+
+    def merge(self, other):
+        '''
+        Adds the counters of other, a SearchStats of a part of the same
+        search (for example run by a worker process).
+        '''
+        for level, count in enumerate(other.expanded):
+            if level < len(self.expanded):
+                self.expanded[level] += count
+            else:
+                self.expanded.append(count)
+        self.leaves += other.leaves
+        self.cutoffs += other.cutoffs
+        self.cache_hits += other.cache_hits
+        self.pruned += other.pruned
+        self.allocations += other.allocations
+        self.cancelled = self.cancelled or other.cancelled
+
+    def as_dict(self):
+        return {
+            "depth": self.depth,
+            "nodes": self.node_count(),
+            "expanded": list(self.expanded),
+            "leaves": self.leaves,
+            "cutoffs": self.cutoffs,
+            "cutoff_rate": self.cutoff_rate(),
+            "cache_hits": self.cache_hits,
+            "pruned": self.pruned,
+            "allocations": self.allocations,
+            "allocations_per_node": self.allocations_per_node(),
+            "cancelled": self.cancelled,
+            "elapsed": self.elapsed,
+            "branching_factor": self.branching_factor(),
+        }
+
+    def __repr__(self):
+        return "SearchStats(" + json.dumps(self.as_dict()) + ")"
+
+class RingBufferSink(object):
+    '''
+    Keeps the stats of the latest size searches in memory.
+    '''
+    def __init__(self, size=1000):
+        self.records = deque(maxlen=size)
+
+    def emit(self, stats):
+        self.records.append(stats.as_dict())
+
+class JsonlSink(object):
+    '''
+    Appends the stats of every search as a JSON line to a file.
+    '''
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def emit(self, stats):
+        self.file.write(json.dumps(stats.as_dict()) + "\n")
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,121 @@
+'''
+The eight rotations and reflections of the board (the dihedral group of the
+square), for packed boards. Boards equal under one of these transforms have
+the same game tree, so a position cache keyed on the canonical form can
+share one entry between all of them, as long as the evaluation is symmetric
+too. SymmetricHeuristic provides such an evaluation.
+'''
+import bitboard
+
+def flip_horizontal(b):
+    '''
+    Mirrors the board left to right.
+    '''
+    r = bitboard.reverse_row
+    mask = bitboard.ROW_MASK
+    return (r(b & mask) | (r((b >> 16) & mask) << 16)
+        | (r((b >> 32) & mask) << 32) | (r(b >> 48) << 48))
+
+
+def flip_vertical(b):
+    '''
+    Mirrors the board top to bottom.
+    '''
+    mask = bitboard.ROW_MASK
+    return ((b >> 48) | (((b >> 32) & mask) << 16)
+        | (((b >> 16) & mask) << 32) | ((b & mask) << 48))
+
+
+def _identity(b):
+    return b
+
+
+def _rotate_180(b):
+    return flip_horizontal(flip_vertical(b))
+
+
+def _rotate_right(b):
+    return flip_horizontal(bitboard.transpose(b))
+
+
+def _rotate_left(b):
+    return flip_vertical(bitboard.transpose(b))
+
+
+def _anti_transpose(b):
+    return _rotate_180(bitboard.transpose(b))
+
+TRANSFORMS = (
+    _identity,
+    flip_horizontal,
+    flip_vertical,
+    _rotate_180,
+    bitboard.transpose,
+    _rotate_right,
+    _rotate_left,
+    _anti_transpose,
+)
+
+
+def _build_inverse():
+    probe = 0xFEDCBA9876543210
+    inverse = []
+    for t in TRANSFORMS:
+        moved = t(probe)
+        inverse.append(next(i for i, u in enumerate(TRANSFORMS) if u(moved) == probe))
+    return tuple(inverse)
+
+#INVERSE[t] undoes TRANSFORMS[t].
+INVERSE = _build_inverse()
+
+
+def transform(b, t):
+    return TRANSFORMS[t](b)
+
+
+def canonical(b):
+    '''
+    Returns (canonical board, t) where the canonical board is the smallest
+    of the eight symmetric boards, and TRANSFORMS[t](b) gives it.
+    '''
+    best, best_t = b, 0
+    for t in range(1, 8):
+        moved = TRANSFORMS[t](b)
+        if moved < best:
+            best, best_t = moved, t
+    return best, best_t
+
+
+def canonical_board(b):
+    '''
+    Only the canonical board, without the transform. Used for cache keys.
+    '''
+    f = bitboard.transpose(b)
+    h = flip_horizontal(b)
+    v = flip_vertical(b)
+    return min(b, h, v, flip_horizontal(v), f, flip_horizontal(f),
+        flip_vertical(f), flip_horizontal(flip_vertical(f)))
+
+class SymmetricHeuristic(object):
+    '''
+    Wraps a HeuristicTable so symmetric boards get the same score. The
+    table heuristic prefers the bottom right corner and a direction for
+    monotonicity, so a board is scored in the orientation that suits it
+    best. This is what makes canonical cache keys safe to use.
+    '''
+    def __init__(self, table):
+        self.table = table
+        self.weights = table.weights
+
+    def bounds(self):
+        return self.table.bounds()
+
+    def evaluate(self, b):
+        evaluate = self.table.evaluate
+        f = bitboard.transpose(b)
+        h = flip_horizontal(b)
+        v = flip_vertical(b)
+        return max(evaluate(b), evaluate(h), evaluate(v),
+            evaluate(flip_horizontal(v)), evaluate(f),
+            evaluate(flip_horizontal(f)), evaluate(flip_vertical(f)),
+            evaluate(flip_horizontal(flip_vertical(f))))